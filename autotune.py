@@ -0,0 +1,242 @@
+"""Tune the numeric thresholds of the pose rules against labeled recordings.
+
+Takes landmark recordings (.ylm, saved by the app with "Record landmarks"
+ticked) together with a label file next to each one, and sweeps every
+"min"/"max" bound in each pose's rules for the best F-score of the rule
+verdict against the labels. Rule evaluation is vectorized over all frames
+and all candidate values of a bound at once, and poses are tuned in
+parallel, one per worker process. The tuned rules are written to a new
+instructions file, with a precision/recall report per pose.
+
+A label file is "<recording>.labels.json" and holds either one label for
+the whole recording or time segments, in seconds from its first frame;
+frames outside every segment are left out:
+    {"correct": true}
+    {"segments": [{"start": 0.0, "end": 4.5, "correct": false},
+                  {"start": 4.5, "end": 30.0, "correct": true}]}
+
+Rules in "world" feature mode are left untouched, since recordings hold
+image landmarks only.
+
+Example:
+    python autotune.py recordings/ -o pose_instructions.tuned.json --report autotune_report.json
+"""
+import argparse
+import copy
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+
+from yoga_core import ANGLE_INDEX, DEFAULT_POSE_RULES, FEATURE_INDEX, LandmarkReplay, extract_features
+
+RECORDING_EXTENSION = ".ylm"
+LABELS_SUFFIX = ".labels.json"
+
+def find_recordings(paths):
+    """Expand input paths into labeled recordings"""
+    recordings = []
+    for path in paths:
+        names = [path] if os.path.isfile(path) else \
+            [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        for name in names:
+            if name.lower().endswith(RECORDING_EXTENSION) and os.path.exists(name + LABELS_SUFFIX):
+                recordings.append(name)
+    return recordings
+
+def frame_labels(timestamps, labels):
+    """Per-frame labels: 1 correct, 0 incorrect, -1 unlabeled"""
+    result = np.full(len(timestamps), -1, dtype=np.int8)
+    if "correct" in labels:
+        result[:] = bool(labels["correct"])
+        return result
+    elapsed = timestamps - timestamps[0] if len(timestamps) else timestamps
+    for segment in labels.get("segments", []):
+        inside = (elapsed >= segment["start"]) & (elapsed < segment["end"])
+        result[inside] = bool(segment["correct"])
+    return result
+
+def load_recording(path, pose_name=None):
+    """(pose name, features, labels) of the labeled, detected frames of one recording"""
+    replay = LandmarkReplay(path)
+    with open(path + LABELS_SUFFIX, "r") as f:
+        labels = frame_labels(replay.timestamps, json.load(f))
+    keep = replay.detected & (labels >= 0)
+    return pose_name or replay.pose_name, extract_features(replay.landmarks[keep]), labels[keep] == 1
+
+# ===== Vectorized rule evaluation =====
+# A condition is flattened into a tree of ("all"/"any", [children]) and
+# ("leaf", i) nodes over a list of leaf specs, so each leaf's tested value is
+# computed once and only the leaf being tuned is re-evaluated per candidate.
+
+def flatten(spec, leaves):
+    if "any" in spec or "all" in spec:
+        op = "any" if "any" in spec else "all"
+        return op, [flatten(part, leaves) for part in spec[op]]
+    leaves.append(spec)
+    return "leaf", len(leaves) - 1
+
+def leaf_values(spec, features):
+    """The value a feature test compares against its bounds, for every frame"""
+    values = features[:, FEATURE_INDEX[spec["feature"]]]
+    if "relative_to" in spec:
+        values = values - features[:, FEATURE_INDEX[spec["relative_to"]]]
+    return np.abs(values) if spec.get("abs") else values
+
+def leaf_result(values, lo, hi):
+    """lo < values < hi; lo and hi may be (k, 1) candidate columns, giving (k, n)"""
+    return (lo < values) & (values < hi)
+
+def evaluate(node, results):
+    op, children = node
+    if op == "leaf":
+        return results[children]
+    parts = [evaluate(child, results) for child in children]
+    return reduce(np.logical_and if op == "all" else np.logical_or, parts)
+
+def score(verdicts, labels, beta=1.0):
+    """(f-score, precision, recall) of verdicts against labels; "correct" is the positive class.
+
+    verdicts may be (n,) or (k, n), in which case each statistic is a (k,) array.
+    """
+    tp = (verdicts & labels).sum(axis=-1)
+    fp = (verdicts & ~labels).sum(axis=-1)
+    fn = (~verdicts & labels).sum(axis=-1)
+    precision = tp / np.maximum(tp + fp, 1)
+    recall = tp / np.maximum(tp + fn, 1)
+    b2 = beta * beta
+    f = (1 + b2) * precision * recall / np.maximum(b2 * precision + recall, 1e-12)
+    return f, precision, recall
+
+def candidate_bounds(spec, bound, values, count):
+    """Current value plus quantiles of the tested values, rounded like hand-written thresholds"""
+    decimals = 1 if spec["feature"] in ANGLE_INDEX else 3
+    quantiles = np.quantile(values, np.linspace(0, 1, count)) if len(values) else []
+    return np.unique(np.round(np.append(quantiles, spec[bound]), decimals))
+
+def tune_pose(pose_name, data, features, labels, beta=1.0, candidates=64, passes=3):
+    """Coordinate-wise sweep of one pose's thresholds; returns (rules, report)"""
+    rules = copy.deepcopy(data.get("rules", DEFAULT_POSE_RULES))
+    leaves, nodes = [], []
+    for rule in rules:
+        if rule.get("feature_mode", data.get("feature_mode", "image")) != "world":
+            nodes.append(flatten(rule["require"], leaves))
+    values = [leaf_values(spec, features) for spec in leaves]
+    results = [leaf_result(v, spec.get("min", -np.inf), spec.get("max", np.inf))
+               for v, spec in zip(values, leaves)]
+
+    def verdicts():
+        return reduce(np.logical_and, (evaluate(node, results) for node in nodes),
+                      np.ones(len(labels), dtype=bool))
+
+    before = score(verdicts(), labels, beta)
+    best = before[0]
+    changes = []
+    for _ in range(passes):
+        improved = False
+        for i, spec in enumerate(leaves):
+            for bound in ("min", "max"):
+                if bound not in spec:
+                    continue
+                options = candidate_bounds(spec, bound, values[i], candidates)
+                column = options[:, None]
+                lo = column if bound == "min" else spec.get("min", -np.inf)
+                hi = column if bound == "max" else spec.get("max", np.inf)
+                saved = results[i]
+                results[i] = leaf_result(values[i], lo, hi)
+                f = score(verdicts(), labels, beta)[0]
+                results[i] = saved
+                choice = int(np.argmax(f))
+                # Hand-written values stay unless a candidate strictly beats them
+                if f[choice] > best + 1e-9:
+                    changes.append({"feature": spec["feature"], "bound": bound,
+                                    "old": spec[bound], "new": float(options[choice])})
+                    spec[bound] = float(options[choice])
+                    results[i] = leaf_result(values[i], spec.get("min", -np.inf),
+                                             spec.get("max", np.inf))
+                    best = f[choice]
+                    improved = True
+        if not improved:
+            break
+
+    after = score(verdicts(), labels, beta)
+    report = {"frames": int(len(labels)), "positives": int(labels.sum()),
+              "before": {"f": round(float(before[0]), 4), "precision": round(float(before[1]), 4),
+                         "recall": round(float(before[2]), 4)},
+              "after": {"f": round(float(after[0]), 4), "precision": round(float(after[1]), 4),
+                        "recall": round(float(after[2]), 4)},
+              "changes": changes}
+    return rules, report
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune pose rule thresholds against labeled landmark recordings")
+    parser.add_argument("inputs", nargs="+", help=".ylm recordings or directories of them, "
+                                                  "each with a <recording>.labels.json next to it")
+    parser.add_argument("--pose", help="treat every recording as this pose instead of the one it was recorded for")
+    parser.add_argument("-o", "--output", default="pose_instructions.tuned.json",
+                        help="instructions file to write with the tuned rules")
+    parser.add_argument("--report", help="write the precision/recall report as JSON to this file")
+    parser.add_argument("--instructions", default="pose_instructions.json", help="pose definitions file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="process pool size, one pose per worker")
+    parser.add_argument("--beta", type=float, default=1.0,
+                        help="F-score weight of recall over precision, e.g. 0.5 favors precision")
+    parser.add_argument("--candidates", type=int, default=64, help="values tried per threshold and pass")
+    parser.add_argument("--passes", type=int, default=3, help="sweeps over all thresholds")
+    args = parser.parse_args()
+
+    with open(args.instructions, "r") as f:
+        pose_data = json.load(f)
+    if args.pose and args.pose not in pose_data:
+        parser.error(f"unknown pose '{args.pose}'")
+
+    missing = [path for path in args.inputs if not os.path.exists(path)]
+    if missing:
+        parser.error(f"no such file or directory: {', '.join(missing)}")
+    recordings = find_recordings(args.inputs)
+    if not recordings:
+        parser.error(f"no recordings with a {LABELS_SUFFIX} file found")
+
+    started = time.perf_counter()
+    frames = {}
+    for path in recordings:
+        pose_name, features, labels = load_recording(path, args.pose)
+        if pose_name not in pose_data:
+            print(f"{path}: skipping unknown pose '{pose_name}'")
+            continue
+        frames.setdefault(pose_name, []).append((features, labels))
+
+    jobs = {pose_name: (np.concatenate([features for features, _ in parts]),
+                        np.concatenate([labels for _, labels in parts]))
+            for pose_name, parts in frames.items()}
+    tuned = copy.deepcopy(pose_data)
+    reports = {}
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as pool:
+        futures = {pose_name: pool.submit(tune_pose, pose_name, pose_data[pose_name], features, labels,
+                                          args.beta, args.candidates, args.passes)
+                   for pose_name, (features, labels) in jobs.items()}
+        for pose_name, future in futures.items():
+            tuned[pose_name]["rules"], reports[pose_name] = future.result()
+
+    print(f"  {'pose':<32}{'frames':>8}{'precision':>18}{'recall':>18}{'F':>18}")
+    for pose_name, report in reports.items():
+        before, after = report["before"], report["after"]
+        print(f"  {pose_name:<32}{report['frames']:>8}"
+              + "".join(f"{before[key]:>9.3f} ->{after[key]:>6.3f}" for key in ("precision", "recall", "f")))
+        for change in report["changes"]:
+            print(f"      {change['feature']} {change['bound']}: {change['old']} -> {change['new']}")
+
+    with open(args.output, "w") as f:
+        json.dump(tuned, f, indent=2, ensure_ascii=False)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(reports, f, indent=2)
+    total = sum(len(labels) for _, labels in jobs.values())
+    print(f"Tuned {len(jobs)} poses over {total} labeled frames in "
+          f"{time.perf_counter() - started:.1f}s -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Reproducible benchmark of the per-frame hot path.
+
+Drives the same stages the live session runs for every camera frame -
+color conversion, pose.process, the display resize, draw_landmarks, PIL
+and PhotoImage conversion and the rule check - with synthetic frames, a
+video file or a landmark recording, at several resolutions. Reports
+p50/p95/p99 per stage and end-to-end FPS, and can save or compare against
+a baseline so regressions show up in CI. No camera is needed; the
+PhotoImage stage is skipped when no display is available.
+
+--frame-path runs a micro-benchmark of the display path alone, comparing
+the original convert/copy/LANCZOS path with the current one for latency
+and per-frame allocations.
+
+Example:
+    python benchmark.py --resolutions 640x480 1280x720 --save-baseline bench_baseline.json
+    python benchmark.py --compare bench_baseline.json --tolerance 0.2
+    python benchmark.py --frame-path
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import yoga_core
+from yoga_core import DISPLAY_SIZE, LandmarkReplay, PoseChecker
+
+STAGES = ("bgr_to_rgb", "pose_process", "resize", "draw_landmarks",
+          "to_pil", "photoimage", "rule_check")
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def synthetic_frames(width, height, count, seed=0):
+    """Noise frames with a moving bright block, so codecs and detectors see change"""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = base.copy()
+        x = (i * 7) % max(width - width // 4, 1)
+        frame[height // 4:height // 2, x:x + width // 4] = 255
+        frames.append(frame)
+    return frames
+
+def video_frames(path, width, height, count):
+    """Up to count frames of a video, resized to the benchmark resolution"""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (width, height)))
+    cap.release()
+    if not frames:
+        raise SystemExit(f"could not read frames from {path}")
+    while len(frames) < count:
+        frames.extend(frames[:count - len(frames)])
+    return frames
+
+def landmark_sets(recording, count, seed=0):
+    """(33, 4) landmark arrays used when the detector finds nobody in a frame"""
+    if recording:
+        replay = LandmarkReplay(recording)
+        points = np.asarray(replay.landmarks[replay.detected])
+        if len(points):
+            return [points[i % len(points)] for i in range(count)]
+    rng = np.random.default_rng(seed)
+    points = rng.random((count, 33, 4)).astype(np.float32)
+    points[..., 3] = 1.0
+    return list(points)
+
+def to_landmark_list(points):
+    """Build a MediaPipe landmark proto so draw_landmarks can run on synthetic data"""
+    try:
+        from mediapipe.framework.formats import landmark_pb2
+    except ImportError:
+        return None
+    landmark_list = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, visibility in points.tolist():
+        landmark_list.landmark.add(x=x, y=y, z=z, visibility=visibility)
+    return landmark_list
+
+def make_tk_root():
+    """A hidden Tk root for PhotoImage creation, or None when headless"""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return root
+    except Exception:
+        return None
+
+def run_benchmark(frames, points, checker, pose_name, tk_root, model_complexity=1, warmup=10):
+    """Time every stage for each frame; returns {stage: [milliseconds, ...]}"""
+    samples = {stage: [] for stage in STAGES + ("end_to_end",)}
+    if tk_root is not None:
+        from PIL import ImageTk  # Pulls in tkinter, so only with a display
+    # MediaPipe loads on first use, so --frame-path and --help run without it
+    mp_pose, mp_drawing = yoga_core.mp_pose, yoga_core.mp_drawing
+    display = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+    with mp_pose.Pose(model_complexity=model_complexity,
+                      min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
+        for i, frame in enumerate(frames):
+            timings = {}
+            frame_start = time.perf_counter()
+
+            start = time.perf_counter()
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+            timings["bgr_to_rgb"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = pose.process(frame)
+            timings["pose_process"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            image = cv2.resize(frame, DISPLAY_SIZE, dst=display, interpolation=cv2.INTER_LINEAR)
+            timings["resize"] = time.perf_counter() - start
+
+            landmark_list = results.pose_landmarks or to_landmark_list(points[i])
+            if landmark_list is not None:
+                start = time.perf_counter()
+                mp_drawing.draw_landmarks(
+                    image, landmark_list, mp_pose.POSE_CONNECTIONS,
+                    mp_drawing.DrawingSpec(color=(245,117,66), thickness=2, circle_radius=2),
+                    mp_drawing.DrawingSpec(color=(245,66,230), thickness=2, circle_radius=2)
+                )
+                timings["draw_landmarks"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            img = Image.fromarray(image)
+            timings["to_pil"] = time.perf_counter() - start
+
+            if tk_root is not None:
+                start = time.perf_counter()
+                ImageTk.PhotoImage(img, master=tk_root)
+                timings["photoimage"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            checker.check(pose_name, points[i])
+            timings["rule_check"] = time.perf_counter() - start
+
+            timings["end_to_end"] = time.perf_counter() - frame_start
+            if i >= warmup:
+                for stage, seconds in timings.items():
+                    samples[stage].append(1000.0 * seconds)
+    return {stage: values for stage, values in samples.items() if values}
+
+def legacy_frame_path(frame):
+    """Display path before the zero-copy rework: two conversions, a copy and a LANCZOS resize"""
+    image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    image = image.copy()
+    return Image.fromarray(image).resize(DISPLAY_SIZE, Image.Resampling.LANCZOS)
+
+def current_frame_path(frame, display):
+    """Display path used by the live session: in-place conversion, resize into a reused buffer"""
+    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+    image = cv2.resize(frame, DISPLAY_SIZE, dst=display, interpolation=cv2.INTER_LINEAR)
+    return Image.fromarray(image)
+
+def frame_path_benchmark(frames):
+    """Latency and NumPy/OpenCV bytes allocated per frame for both display paths"""
+    display = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+    paths = {"legacy": legacy_frame_path,
+             "current": lambda frame: current_frame_path(frame, display)}
+    report = {}
+    for name, path in paths.items():
+        latencies = []
+        for frame in frames:
+            start = time.perf_counter()
+            path(frame)
+            latencies.append(1000.0 * (time.perf_counter() - start))
+
+        # Allocations are measured in a separate pass so tracing doesn't skew latency
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        allocated = 0
+        for frame in frames:
+            tracemalloc.reset_peak()
+            path(frame)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+
+        p50, p95 = np.percentile(latencies, [50, 95])
+        report[name] = {"p50": round(float(p50), 4), "p95": round(float(p95), 4),
+                        "kib_per_frame": round(allocated / len(frames) / 1024.0, 1)}
+    return report
+
+def summarize(samples):
+    """Percentiles in milliseconds per stage, plus end-to-end FPS"""
+    summary = {}
+    for stage, values in samples.items():
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary[stage] = {"p50": round(float(p50), 4), "p95": round(float(p95), 4),
+                          "p99": round(float(p99), 4), "n": len(values)}
+    if "end_to_end" in samples:
+        summary["fps"] = round(1000.0 / float(np.mean(samples["end_to_end"])), 2)
+    return summary
+
+def compare(results, baseline, tolerance):
+    """List of regressions where p50 or p95 got slower than baseline by more than tolerance"""
+    regressions = []
+    for resolution, stages in results.items():
+        for stage, stats in stages.items():
+            if stage == "fps":
+                continue
+            reference = baseline.get(resolution, {}).get(stage)
+            if not reference:
+                continue
+            for key in ("p50", "p95"):
+                if stats[key] > reference[key] * (1.0 + tolerance):
+                    regressions.append(f"{resolution} {stage} {key}: "
+                                       f"{reference[key]:.3f}ms -> {stats[key]:.3f}ms")
+    return regressions
+
+def print_results(results):
+    for resolution, stages in results.items():
+        print(f"\n{resolution}  ({stages.get('fps', 0):.1f} FPS end-to-end)")
+        print(f"  {'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage in STAGES + ("end_to_end",):
+            if stage in stages:
+                s = stages[stage]
+                print(f"  {stage:<16}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['p99']:>10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-frame hot path without a camera")
+    parser.add_argument("--resolutions", nargs="+", default=["320x240", "640x480", "1280x720"])
+    parser.add_argument("--frames", type=int, default=200, help="frames per resolution")
+    parser.add_argument("--warmup", type=int, default=10, help="initial frames excluded from stats")
+    parser.add_argument("--video", help="use frames from this video instead of synthetic ones")
+    parser.add_argument("--recording", help="landmark recording (.ylm) used for drawing and rule checks")
+    parser.add_argument("--pose", default="Mountain Pose", help="pose checked by the rule stage")
+    parser.add_argument("--model-complexity", type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument("--instructions", default="pose_instructions.json")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--save-baseline", help="store results as the baseline at this path")
+    parser.add_argument("--compare", help="baseline file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, e.g. 0.2 = 20%%")
+    parser.add_argument("--frame-path", action="store_true",
+                        help="only compare the legacy and current display paths")
+    args = parser.parse_args()
+
+    if args.frame_path:
+        print(f"  {'resolution':<12}{'path':<10}{'p50 ms':>10}{'p95 ms':>10}{'KiB/frame':>12}")
+        for text in args.resolutions:
+            width, height = parse_resolution(text)
+            frames = synthetic_frames(width, height, args.frames)
+            for name, stats in frame_path_benchmark(frames).items():
+                print(f"  {text:<12}{name:<10}{stats['p50']:>10.3f}{stats['p95']:>10.3f}"
+                      f"{stats['kib_per_frame']:>12.1f}")
+        return
+
+    with open(args.instructions, "r") as f:
+        checker = PoseChecker(json.load(f))
+    if args.pose not in checker.rules:
+        parser.error(f"unknown pose '{args.pose}'")
+
+    tk_root = make_tk_root()
+    if tk_root is None:
+        print("No display available; skipping the photoimage stage")
+
+    total = args.frames + args.warmup
+    points = landmark_sets(args.recording, total)
+    results = {}
+    for text in args.resolutions:
+        width, height = parse_resolution(text)
+        if args.video:
+            frames = video_frames(args.video, width, height, total)
+        else:
+            frames = synthetic_frames(width, height, total)
+        samples = run_benchmark(frames, points, checker, args.pose, tk_root,
+                                args.model_complexity, args.warmup)
+        results[text] = summarize(samples)
+
+    print_results(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
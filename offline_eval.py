@@ -0,0 +1,201 @@
+"""Headless batch evaluation of the pose checker over recorded videos.
+
+Runs the same MediaPipe + rule pipeline as the live app over video files or
+directories of image frames, as fast as the CPU allows, and writes one
+record per frame (verdict, feedback, top classifier poses, timings) to a
+JSONL or CSV file. Landmark recordings (.ylm, saved by the app with "Record
+landmarks" ticked) are replayed straight into the rules, skipping inference.
+
+Example:
+    python offline_eval.py recordings/ --pose "Tree Pose" --workers 4 -o results.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+import yoga_core
+from yoga_core import LandmarkReplay, PoseChecker, extract_features, landmarks_to_array
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+RECORDING_EXTENSION = ".ylm"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+CSV_FIELDS = ["source", "frame", "timestamp_ms", "detected", "pose_ok", "feedback",
+              "wrong_pose", "top_poses", "inference_ms", "rules_ms"]
+
+def is_image_sequence(path):
+    """A directory holding image frames is evaluated as one sequence"""
+    return os.path.isdir(path) and any(name.lower().endswith(IMAGE_EXTENSIONS)
+                                       for name in os.listdir(path))
+
+def find_sources(paths):
+    """Expand input paths into video files and image-sequence directories"""
+    sources = []
+    for path in paths:
+        if os.path.isfile(path):
+            sources.append(path)
+            continue
+        if is_image_sequence(path):
+            sources.append(path)
+        for name in sorted(os.listdir(path)):
+            child = os.path.join(path, name)
+            if name.lower().endswith(VIDEO_EXTENSIONS + (RECORDING_EXTENSION,)) or is_image_sequence(child):
+                sources.append(child)
+    return sources
+
+def read_frames(source):
+    """Yield (timestamp_ms, BGR frame) from a video file or an image directory"""
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for i, name in enumerate(names):
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                yield i * 1000.0 / 30, frame  # Image sequences are assumed to be 30 FPS
+        return
+
+    cap = cv2.VideoCapture(source)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield cap.get(cv2.CAP_PROP_POS_MSEC), frame
+    finally:
+        cap.release()
+
+def evaluate_recording(source, pose_name, checker):
+    """Replay a landmark recording through the rules; no capture or inference"""
+    replay = LandmarkReplay(source)
+    pose_name = pose_name or replay.pose_name
+    if pose_name not in checker.rules:
+        pose_name = None
+
+    start = time.perf_counter()
+    features = extract_features(replay.landmarks)
+    feature_ms = 1000.0 * (time.perf_counter() - start) / max(len(replay), 1)
+
+    records = []
+    for i, (timestamp, points) in enumerate(replay):
+        record = {"source": source, "frame": i,
+                  "timestamp_ms": round(1000.0 * (timestamp - replay.timestamps[0]), 1),
+                  "detected": points is not None, "pose_ok": None, "feedback": None,
+                  "wrong_pose": None, "top_poses": [], "inference_ms": 0.0, "rules_ms": None}
+        if points is not None:
+            start = time.perf_counter()
+            if pose_name:
+                record["pose_ok"], record["feedback"], record["wrong_pose"] = \
+                    checker.check(pose_name, points, features[i])
+            record["top_poses"] = [[name, round(confidence, 4)]
+                                   for name, confidence in checker.classifier.classify(features[i])]
+            record["rules_ms"] = round(feature_ms + 1000.0 * (time.perf_counter() - start), 3)
+        records.append(record)
+    return records
+
+def evaluate_source(source, pose_name, pose_data, model_complexity=1):
+    """Run detection and rule checks over every frame of one source"""
+    checker = PoseChecker(pose_data)
+    if source.lower().endswith(RECORDING_EXTENSION):
+        return evaluate_recording(source, pose_name, checker)
+
+    records = []
+    with yoga_core.mp_pose.Pose(model_complexity=model_complexity,
+                                min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
+        for i, (timestamp_ms, frame) in enumerate(read_frames(source)):
+            start = time.perf_counter()
+            results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            inference_ms = 1000.0 * (time.perf_counter() - start)
+
+            record = {"source": source, "frame": i, "timestamp_ms": round(timestamp_ms, 1),
+                      "detected": results.pose_landmarks is not None, "pose_ok": None,
+                      "feedback": None, "wrong_pose": None, "top_poses": [],
+                      "inference_ms": round(inference_ms, 3), "rules_ms": None}
+            if results.pose_landmarks:
+                start = time.perf_counter()
+                points = landmarks_to_array(results.pose_landmarks.landmark)
+                features = extract_features(points)
+                if pose_name:
+                    record["pose_ok"], record["feedback"], record["wrong_pose"] = \
+                        checker.check(pose_name, points, features)
+                record["top_poses"] = [[name, round(confidence, 4)]
+                                       for name, confidence in checker.classifier.classify(features)]
+                record["rules_ms"] = round(1000.0 * (time.perf_counter() - start), 3)
+            records.append(record)
+    return records
+
+def write_records(records, handle, fmt, writer=None):
+    """Append records to an open JSONL or CSV output"""
+    for record in records:
+        if fmt == "csv":
+            row = dict(record, top_poses=";".join(f"{name}:{conf}" for name, conf in record["top_poses"]))
+            writer.writerow(row)
+        else:
+            handle.write(json.dumps(record) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate pose rules over recorded videos without a camera or display")
+    parser.add_argument("inputs", nargs="+",
+                        help="video files or .ylm recordings, or directories of them / of image frames")
+    parser.add_argument("--pose", help="pose to check against; if omitted, recordings use their own "
+                                       "pose and other sources only run the classifier")
+    parser.add_argument("-o", "--output", default="offline_eval.jsonl", help="output file (.jsonl or .csv)")
+    parser.add_argument("--workers", type=int, default=1, help="process pool size, one source per worker")
+    parser.add_argument("--model-complexity", type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument("--instructions", default="pose_instructions.json", help="pose definitions file")
+    args = parser.parse_args()
+
+    with open(args.instructions, "r") as f:
+        pose_data = json.load(f)
+    if args.pose and args.pose not in pose_data:
+        parser.error(f"unknown pose '{args.pose}'")
+
+    missing = [path for path in args.inputs if not os.path.exists(path)]
+    if missing:
+        parser.error(f"no such file or directory: {', '.join(missing)}")
+    sources = find_sources(args.inputs)
+    if not sources:
+        parser.error("no videos or image sequences found")
+
+    fmt = "csv" if args.output.lower().endswith(".csv") else "jsonl"
+    started = time.perf_counter()
+    total_frames = 0
+    with open(args.output, "w", newline="") as handle:
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(handle, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+
+        def report(source, records):
+            detected = sum(r["detected"] for r in records)
+            correct = sum(bool(r["pose_ok"]) for r in records)
+            busy = sum(r["inference_ms"] + (r["rules_ms"] or 0.0) for r in records)
+            fps = 1000.0 * len(records) / busy if busy else 0.0
+            print(f"{source}: {len(records)} frames, {detected} detected, {correct} correct, "
+                  f"{fps:.1f} FPS")
+            write_records(records, handle, fmt, writer)
+
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                futures = [(source, pool.submit(evaluate_source, source, args.pose, pose_data,
+                                                args.model_complexity))
+                           for source in sources]
+                for source, future in futures:
+                    records = future.result()
+                    total_frames += len(records)
+                    report(source, records)
+        else:
+            for source in sources:
+                records = evaluate_source(source, args.pose, pose_data, args.model_complexity)
+                total_frames += len(records)
+                report(source, records)
+
+    elapsed = time.perf_counter() - started
+    print(f"Processed {total_frames} frames from {len(sources)} sources in {elapsed:.1f}s "
+          f"({total_frames / elapsed if elapsed else 0:.1f} FPS overall) -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""Run several independent pose sessions from one machine.
+
+A session is one person practicing one pose in front of a camera, with its
+own hold timer and feedback. Several cameras can be used at once, and
+several sessions can share a camera by each taking a region of the frame
+(e.g. two mats side by side), since the MediaPipe pose solution tracks a
+single person per image.
+
+Cameras are read in the main process into shared-memory frame rings, so
+frames are never pickled. Inference runs in a pool of worker processes,
+each owning one MediaPipe Pose per session it serves (Pose instances keep
+per-stream tracking state and cannot be shared). Workers send status,
+timer and speech events back to the main process, which prints them and
+optionally speaks them.
+
+Example:
+    python session_server.py --session "0:Tree Pose" --session "1:Chair Pose"
+    python session_server.py --session "0:Tree Pose@0,0,0.5,1" --session "0:Cat Pose@0.5,0,1,1"
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+from threading import Lock, Thread
+
+import cv2
+import numpy as np
+
+import yoga_core
+from yoga_core import PRIORITY_FEEDBACK, PoseChecker, PoseSession, landmarks_to_array, speak
+
+FRAME_SLOTS = 4  # frames per camera ring: one being written, the rest in flight
+FULL_FRAME = (0.0, 0.0, 1.0, 1.0)
+
+class SharedFrameRing:
+    """A fixed ring of frame slots in shared memory, recycled by reference count.
+
+    The camera reader acquires a free slot, writes a frame into it and
+    publishes it with the number of consumers; each consumer's release
+    frees it again. Workers attach by name and only read.
+    """
+    def __init__(self, shape, slots=FRAME_SLOTS, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                              size=slots * int(np.prod(self.shape)))
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.lock = Lock()
+        self.refs = [0] * slots  # -1 while being written
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self):
+        """Index of a free slot, or None while every slot is in use"""
+        with self.lock:
+            for slot, refs in enumerate(self.refs):
+                if refs == 0:
+                    self.refs[slot] = -1
+                    return slot
+        return None
+
+    def publish(self, slot, consumers):
+        with self.lock:
+            self.refs[slot] = consumers
+
+    def release(self, slot):
+        with self.lock:
+            self.refs[slot] -= 1
+
+    def close(self):
+        self.frames = None  # The view must go before the buffer can close
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def parse_session(text, index):
+    """Parse "CAMERA:POSE[@x0,y0,x1,y1]"; CAMERA is a device index or a video file"""
+    text, _, region = text.partition("@")
+    # Split on the last colon, so Windows paths like C:\vids\a.mp4 keep their drive
+    camera, sep, pose = text.rpartition(":")
+    if not sep or not camera or not pose:
+        raise ValueError(f"session '{text}' should look like CAMERA:POSE")
+    box = FULL_FRAME
+    if region:
+        box = tuple(float(value) for value in region.split(","))
+        if len(box) != 4 or not (0 <= box[0] < box[2] <= 1 and 0 <= box[1] < box[3] <= 1):
+            raise ValueError(f"region '{region}' should be x0,y0,x1,y1 within 0..1")
+    return {"id": index, "name": f"session {index + 1}",
+            "camera": int(camera) if camera.isdigit() else camera,
+            "pose": pose, "region": box}
+
+def crop_region(frame, region):
+    """The part of a frame a session watches, contiguous as MediaPipe requires"""
+    if region == FULL_FRAME:
+        return frame
+    height, width = frame.shape[:2]
+    x0, y0, x1, y1 = region
+    return np.ascontiguousarray(frame[int(y0 * height):int(y1 * height),
+                                      int(x0 * width):int(x1 * width)])
+
+def worker_main(sessions, rings, pose_data, hold_time, model_complexity, tasks, events):
+    """Worker process: run inference and session logic for the sessions it owns"""
+    checker = PoseChecker(pose_data)
+    attached = {camera: SharedFrameRing(shape, slots, name=name)
+                for camera, (name, shape, slots) in rings.items()}
+
+    def callbacks(session_id):
+        def say(text, priority=PRIORITY_FEEDBACK, cooldown=True):
+            events.put(("say", session_id, text, priority, cooldown))
+        def post(key, value=None):
+            events.put(("post", session_id, key, value))
+        return say, post
+
+    states = []
+    for session in sessions:
+        say, post = callbacks(session["id"])
+        states.append((session, PoseSession(checker, session["pose"], hold_time, say=say, post=post),
+                       yoga_core.mp_pose.Pose(model_complexity=model_complexity,
+                                              min_detection_confidence=0.5, min_tracking_confidence=0.5)))
+
+    events.put(("ready",))
+    try:
+        running = True
+        while running:
+            task = tasks.get()
+            if task is None:
+                break
+            # Only the newest frame per camera matters; skip any backlog
+            latest = {task[0]: task}
+            while True:
+                try:
+                    task = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    running = False
+                    break
+                if task[0] in latest:
+                    events.put(("release", latest[task[0]][0], latest[task[0]][1]))
+                latest[task[0]] = task
+
+            for camera, slot, timestamp in latest.values():
+                frame = attached[camera].frames[slot]
+                for session, state, pose in states:
+                    if session["camera"] != camera or state.completed:
+                        continue
+                    results = pose.process(crop_region(frame, session["region"]))
+                    if results.pose_landmarks:
+                        points = landmarks_to_array(results.pose_landmarks.landmark)
+                        # Back to full-frame normalized coordinates
+                        x0, y0, x1, y1 = session["region"]
+                        points[:, 0] = x0 + points[:, 0] * (x1 - x0)
+                        points[:, 1] = y0 + points[:, 1] * (y1 - y0)
+                        points[:, 2] *= x1 - x0
+                        # World landmarks are metric and hip-centred; cropping doesn't affect them
+                        world_points = None
+                        if results.pose_world_landmarks and session["pose"] in checker.world_poses:
+                            world_points = landmarks_to_array(results.pose_world_landmarks.landmark)
+                        state.update(points, timestamp, world_points)
+                events.put(("release", camera, slot))
+    finally:
+        for _, _, pose in states:
+            pose.close()
+        for ring in attached.values():
+            ring.close()
+
+class CameraReader:
+    """Read one camera (or video file) into a shared frame ring and fan frames out to workers"""
+    def __init__(self, source, width=640, height=480):
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+        if isinstance(source, int):
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        ret, frame = self.cap.read()
+        if not ret:
+            raise RuntimeError(f"could not read from camera {source}")
+        self.ring = SharedFrameRing(frame.shape)
+        # Video files are paced at their own frame rate instead of as fast as possible
+        self.interval = None if isinstance(source, int) else 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 30)
+        self.consumers = []  # task queues of workers with a session on this camera
+        self.running = False
+        self.thread = None
+        self.dropped = 0
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        next_frame = time.perf_counter()
+        while self.running:
+            slot = self.ring.acquire()
+            if slot is None:
+                # Workers are behind: drain the camera buffer and drop the frame
+                self.running = self.cap.grab()
+                self.dropped += 1
+                continue
+
+            buffer = self.ring.frames[slot]
+            ret, frame = self.cap.read(buffer)
+            if not ret:
+                self.ring.publish(slot, 0)
+                self.running = False
+                break
+            if frame is not buffer:
+                buffer[...] = frame  # OpenCV allocated a new array after all
+            cv2.cvtColor(buffer, cv2.COLOR_BGR2RGB, dst=buffer)
+
+            self.ring.publish(slot, len(self.consumers))
+            timestamp = time.perf_counter()
+            for tasks in self.consumers:
+                tasks.put((self.source, slot, timestamp))
+
+            if self.interval:
+                next_frame += self.interval
+                time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.cap.release()
+
+    def close(self):
+        self.ring.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several pose sessions across cameras and worker processes")
+    parser.add_argument("--session", action="append", required=True, metavar="CAMERA:POSE[@x0,y0,x1,y1]",
+                        help="add a session; repeat for more. The optional region shares a camera "
+                             "between several people")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (capped at the number of sessions)")
+    parser.add_argument("--hold-time", type=int, default=30, help="seconds each pose must be held")
+    parser.add_argument("--model-complexity", type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument("--instructions", default="pose_instructions.json", help="pose definitions file")
+    parser.add_argument("--speak", action="store_true", help="speak feedback on this machine")
+    args = parser.parse_args()
+
+    with open(args.instructions, "r") as f:
+        pose_data = json.load(f)
+    try:
+        sessions = [parse_session(text, i) for i, text in enumerate(args.session)]
+    except ValueError as e:
+        parser.error(str(e))
+    for session in sessions:
+        if session["pose"] not in pose_data:
+            parser.error(f"unknown pose '{session['pose']}'")
+
+    cameras = {}
+    try:
+        for session in sessions:
+            if session["camera"] not in cameras:
+                cameras[session["camera"]] = CameraReader(session["camera"])
+    except RuntimeError as e:
+        for camera in cameras.values():
+            camera.stop()
+            camera.close()
+        parser.error(str(e))
+    rings = {source: (camera.ring.name, camera.ring.shape, camera.ring.slots)
+             for source, camera in cameras.items()}
+
+    # Spawned workers don't inherit the camera threads or OpenCV state
+    context = multiprocessing.get_context("spawn")
+    worker_count = max(1, min(args.workers, len(sessions)))
+    assigned = [sessions[i::worker_count] for i in range(worker_count)]
+    events = context.Queue()
+    workers = []
+    for owned in assigned:
+        tasks = context.Queue()
+        process = context.Process(target=worker_main, daemon=True,
+                                  args=(owned, rings, pose_data, args.hold_time,
+                                        args.model_complexity, tasks, events))
+        process.start()
+        workers.append((process, tasks))
+        for source in {session["camera"] for session in owned}:
+            cameras[source].consumers.append(tasks)
+
+    # Models load in every worker first; don't drop frames while they do
+    for _ in workers:
+        if events.get()[0] != "ready":
+            raise RuntimeError("unexpected event before workers were ready")
+    print(f"Running {len(sessions)} sessions on {len(cameras)} cameras with {worker_count} workers")
+    for camera in cameras.values():
+        camera.start()
+
+    status = {session["id"]: {"status": None, "timer": None, "done": False} for session in sessions}
+    last_print = 0.0
+    try:
+        while not all(state["done"] for state in status.values()):
+            try:
+                event = events.get(timeout=0.5)
+            except queue.Empty:
+                if not any(camera.running for camera in cameras.values()):
+                    break
+                if not all(process.is_alive() for process, _ in workers):
+                    print("A worker process exited unexpectedly")
+                    break
+                continue
+
+            kind = event[0]
+            if kind == "release":
+                cameras[event[1]].ring.release(event[2])
+            elif kind == "say":
+                _, session_id, text, priority, cooldown = event
+                if args.speak:
+                    prefix = f"{sessions[session_id]['name']}. " if len(sessions) > 1 else ""
+                    speak(prefix + text, priority, cooldown)
+            elif kind == "post":
+                _, session_id, key, value = event
+                state = status[session_id]
+                if key == "stop":
+                    state["done"] = True
+                elif state.get(key) != value:
+                    state[key] = value
+                    if key == "status":
+                        session = sessions[session_id]
+                        print(f"[{session['name']}: {session['pose']}] {value}")
+
+            now = time.monotonic()
+            if now - last_print > 5.0:
+                last_print = now
+                print("  " + " | ".join(f"{sessions[i]['name']}: {state['timer'] or '-'}"
+                                        for i, state in status.items()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for camera in cameras.values():
+            camera.stop()
+        for process, tasks in workers:
+            tasks.put(None)
+        for process, _ in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for camera in cameras.values():
+            camera.close()
+
+    for session in sessions:
+        state = status[session["id"]]
+        result = "completed" if state["done"] else "not completed"
+        print(f"{session['name']} ({session['pose']}, camera {session['camera']}): {result}")
+    dropped = sum(camera.dropped for camera in cameras.values())
+    if dropped:
+        print(f"Dropped {dropped} frames while workers were busy")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import json
+import os
+
+import numpy as np
+
+from yoga_core import PoseChecker, check_pose_rules, extract_features
+
+INSTRUCTIONS = os.path.join(os.path.dirname(__file__), os.pardir, "pose_instructions.json")
+
+
+def test_wrong_pose_never_overrides_a_pose_whose_rules_all_pass():
+    with open(INSTRUCTIONS, "r") as f:
+        checker = PoseChecker(json.load(f))
+    rng = np.random.default_rng(0)
+    passing = 0
+    for _ in range(1000):
+        points = rng.random((33, 4))
+        points[:, 3] = 1.0
+        features = extract_features(points)
+        for pose_name, checks in checker.rules.items():
+            if check_pose_rules(checks, features)[0]:
+                passing += 1
+                assert checker.classifier.wrong_pose(features, pose_name) is None, pose_name
+    assert passing
@@ -0,0 +1,51 @@
+import numpy as np
+
+from yoga_core import PoseSession
+
+
+class ScriptedChecker:
+    """Checker whose verdict for the next frame is set by the test"""
+    def __init__(self):
+        self.pose_ok = True
+
+    def missing_landmarks(self, pose_name, points):
+        return ()
+
+    def check(self, pose_name, points, features=None, world_points=None):
+        return self.pose_ok, None if self.pose_ok else "Straighten your back", None
+
+
+def test_hold_restarts_when_filter_drops_it_on_a_correct_frame():
+    checker = ScriptedChecker()
+    said, events = [], []
+    session = PoseSession(checker, "Tree Pose", hold_time=30,
+                          say=lambda text, priority=0, cooldown=True: said.append(text),
+                          log=lambda kind, value=None: events.append((kind, value)))
+    points = np.zeros((33, 4))
+    frame = 0
+
+    def run(count, pose_ok):
+        nonlocal frame
+        checker.pose_ok = pose_ok
+        for _ in range(count):
+            session.update(points, frame / 30)
+            frame += 1
+
+    run(30, True)
+    assert session.correct_pose
+    first_start = session.hold_start
+
+    # Long enough for the grace period to start, short enough that it only
+    # runs out once the frames are correct again
+    run(36, False)
+    assert session.correct_pose
+    last_wrong = (frame - 1) / 30
+    run(10, True)
+    assert not session.correct_pose
+    assert session.hold_start is None
+    assert [kind for kind, _ in events].count("hold_end") == 1
+
+    run(30, True)
+    assert session.correct_pose
+    assert session.hold_start > last_wrong > first_start
+    assert said.count("Your pose is correct. Timer starting now.") == 2
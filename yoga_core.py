@@ -0,0 +1,1464 @@
+"""Headless core of YogaMate: pose rules, features, sessions and speech.
+
+Imports only NumPy and the standard library, so tools and worker
+processes can use the rules without a display and start quickly.
+MediaPipe is imported on first use of mp_pose / mp_drawing, and pyttsx3
+when the speech worker first starts.
+"""
+import numpy as np
+from threading import Thread, Lock, Condition, Event
+from collections import deque
+import time
+import json
+import os
+import struct
+import heapq
+import hashlib
+import shutil
+import subprocess
+import copy
+import socket
+import sqlite3
+import uuid
+from collections import OrderedDict
+
+try:
+    import winsound
+except ImportError:
+    winsound = None
+
+def __getattr__(name):
+    """Load MediaPipe on first access to mp_pose / mp_drawing; it takes about a second"""
+    if name in ("mp_pose", "mp_drawing"):
+        import mediapipe as mp
+        globals().update(mp_pose=mp.solutions.pose, mp_drawing=mp.solutions.drawing_utils)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+VOICE_COOLDOWN = 4  # seconds between voice feedback
+
+# Camera feed size on screen (width, height); shared with benchmark.py, which
+# times the display path without importing the GUI
+DISPLAY_SIZE = (600, 400)
+
+# Temporal smoothing of landmarks and of the per-frame pose verdict
+LANDMARK_MIN_CUTOFF = 1.0  # Hz; lower means smoother but laggier when still
+LANDMARK_BETA = 5.0        # how quickly the cutoff rises with movement speed
+POSE_CONFIRM_TIME = 0.3    # seconds of mostly-correct frames before the timer starts
+POSE_GRACE_PERIOD = 1.0    # seconds of mostly-wrong frames before the timer resets
+
+# Landmarks a pose's rules depend on must be at least this visible and inside
+# the frame, otherwise the frame is reported as "step back into frame"
+VISIBILITY_THRESHOLD = 0.5
+FRAME_MARGIN = 0.02  # normalized coordinates this far outside 0..1 still count as in frame
+
+# Per-user calibration: distance thresholds in the rules assume a user whose
+# torso (shoulders to hips) spans REFERENCE_TORSO_HEIGHT of the frame height
+# and whose shoulders span REFERENCE_SHOULDER_WIDTH of its width
+CALIBRATION_TIME = 3.0  # seconds of standing in Mountain Pose
+REFERENCE_TORSO_HEIGHT = 0.25
+REFERENCE_SHOULDER_WIDTH = 0.15
+PROFILES_FILE = os.environ.get("YOGAMATE_PROFILES_FILE", "user_profiles.json")
+
+# Sequence (flow) mode: playlists of poses in SEQUENCES_FILE, with a rest of
+# TRANSITION_TIME seconds between poses unless a sequence sets its own
+SEQUENCES_FILE = "pose_sequences.json"
+TRANSITION_TIME = 5.0
+
+# Session telemetry: every session and its events are appended to this database
+TELEMETRY_DB = os.environ.get("YOGAMATE_TELEMETRY_DB", "yogamate_sessions.db")
+
+# Speech priorities: a message discards anything pending with a lower priority
+PRIORITY_FEEDBACK = 0  # corrective feedback, may be superseded
+PRIORITY_INFO = 1      # session announcements and breathing cues
+PRIORITY_SUCCESS = 2   # "pose correct" / completion messages
+
+# Fixed phrases are rendered to audio files once and replayed from disk
+AUDIO_CACHE_DIR = ".audio_cache"
+AUDIO_CACHE_SIZE = 300  # clips kept on disk; least recently used go first
+SESSION_PHRASES = (
+    "Your pose is correct. Timer starting now.",
+    "Excellent! You have held the pose perfectly.",
+)
+BREATHING_PHRASES = ("Inhale slowly", "Hold your breath", "Exhale slowly")
+
+class AudioClipCache:
+    """LRU cache of synthesized phrases on disk, tied to the voice settings.
+
+    The index records the settings (voice, rate, volume) the clips were
+    rendered with; configure() with different settings empties the cache.
+    """
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_clips=AUDIO_CACHE_SIZE):
+        self.directory = directory
+        self.max_clips = max_clips
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock = Lock()
+        self.settings = None
+        self.clips = OrderedDict()  # text -> file name, least recently used first
+        self.load()
+
+    def load(self):
+        """Read the index, keeping only clips whose files still exist"""
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.settings = index.get("settings")
+        for text, name in index.get("clips", []):
+            if os.path.exists(os.path.join(self.directory, name)):
+                self.clips[text] = name
+
+    def save(self):
+        """Write the index atomically (caller holds the lock)"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.index_path + ".tmp", "w") as f:
+                json.dump({"settings": self.settings, "clips": list(self.clips.items())}, f)
+            os.replace(self.index_path + ".tmp", self.index_path)
+        except OSError as e:
+            print(f"Error saving audio cache index: {e}")
+
+    def configure(self, settings):
+        """Drop every clip if they were rendered with different voice settings"""
+        with self.lock:
+            if settings == self.settings:
+                return
+            for name in self.clips.values():
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self.clips.clear()
+            self.settings = settings
+            self.save()
+
+    def get(self, text):
+        """Path of the cached clip for text, or None"""
+        with self.lock:
+            name = self.clips.get(text)
+            if name is None:
+                return None
+            self.clips.move_to_end(text)
+            return os.path.join(self.directory, name)
+
+    def path_for(self, text):
+        """Where the clip for text should be rendered"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16] + ".wav"
+        return os.path.join(self.directory, name)
+
+    def add(self, text, path):
+        """Register a rendered clip, evicting the least recently used ones"""
+        with self.lock:
+            self.clips[text] = os.path.basename(path)
+            self.clips.move_to_end(text)
+            while len(self.clips) > self.max_clips:
+                _, name = self.clips.popitem(last=False)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self.save()
+
+class ClipPlayer:
+    """Play audio files with whatever the platform provides"""
+    def __init__(self):
+        self.command = None
+        if winsound is None:
+            for command in (["afplay"], ["paplay"], ["aplay", "-q"]):
+                if shutil.which(command[0]):
+                    self.command = command
+                    break
+        self.process = None
+
+    @property
+    def available(self):
+        return winsound is not None or self.command is not None
+
+    def play(self, path):
+        """Play a clip, blocking until it finishes or is stopped"""
+        if winsound is not None:
+            winsound.PlaySound(path, winsound.SND_FILENAME)
+            return
+        self.process = subprocess.Popen(self.command + [path], stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+        self.process.wait()
+
+    def stop(self):
+        """Stop the clip being played, from any thread"""
+        if winsound is not None:
+            winsound.PlaySound(None, 0)
+        elif self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+class SpeechWorker:
+    """One long-lived text-to-speech thread fed by a priority queue.
+
+    The cooldown is applied when a message is queued, so rejected messages
+    cost nothing. Identical pending messages are merged, and a higher
+    priority message drops stale lower priority ones (and interrupts one
+    being spoken). The pyttsx3 engine is created on the worker thread on
+    first use, so importing this module needs no speech backend.
+
+    With a clip cache, cached phrases are played from disk instead of being
+    synthesized; phrases spoken live are rendered to the cache while idle.
+    """
+    def __init__(self, cooldown=VOICE_COOLDOWN, rate=150, volume=0.9, cache=None, player=None):
+        self.cooldown = cooldown
+        self.settings = {"rate": rate, "volume": volume, "voice": None}
+        self.settings_changed = False
+        self.cache = cache
+        self.player = player
+        self.cond = Condition()
+        self.pending = []  # heap of (-priority, sequence, text)
+        self.render_jobs = deque()  # phrases to synthesize into the cache when idle
+        self.sequence = 0
+        self.last_accepted = -float("inf")
+        self.last_priority = PRIORITY_FEEDBACK
+        self.speaking = None  # priority of the utterance being spoken
+        self.engine = None
+        self.thread = None
+        self.ready = Event()  # set once the engine is initialized (or failed to)
+
+    def start(self):
+        """Start the worker thread if needed (caller holds the condition)"""
+        if self.thread is None:
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def warm_up(self, timeout=None):
+        """Start the worker and wait until its engine is initialized"""
+        with self.cond:
+            self.start()
+        return self.ready.wait(timeout)
+
+    def say(self, text, priority=PRIORITY_FEEDBACK, cooldown=True):
+        """Queue text for speaking; returns False if the cooldown rejected it"""
+        now = time.monotonic()
+        with self.cond:
+            # Within the cooldown only a more important message gets through
+            if cooldown and now - self.last_accepted < self.cooldown and priority <= self.last_priority:
+                return False
+            if any(pending == text for _, _, pending in self.pending):
+                return True
+
+            # Stale lower priority messages are superseded
+            kept = [item for item in self.pending if -item[0] >= priority]
+            if len(kept) != len(self.pending):
+                self.pending = kept
+                heapq.heapify(self.pending)
+            interrupt = self.speaking is not None and self.speaking < priority
+
+            heapq.heappush(self.pending, (-priority, self.sequence, text))
+            self.sequence += 1
+            self.last_accepted = now
+            self.last_priority = priority
+            self.cond.notify()
+            self.start()
+
+        if interrupt:
+            self.interrupt()
+        return True
+
+    def prerender(self, phrases):
+        """Render phrases into the clip cache in the background"""
+        if self.cache is None:
+            return
+        with self.cond:
+            self.render_jobs.extend(text for text in phrases if self.cache.get(text) is None)
+            self.cond.notify()
+            self.start()
+
+    def update_settings(self, **settings):
+        """Change rate, volume or voice; cached clips are invalidated"""
+        with self.cond:
+            self.settings.update(settings)
+            self.settings_changed = True
+            self.cond.notify()
+            self.start()
+
+    def interrupt(self):
+        """Cut off whatever is being spoken or played"""
+        try:
+            if self.player is not None:
+                self.player.stop()
+            if self.engine is not None:
+                self.engine.stop()
+        except Exception:
+            pass
+
+    def apply_settings(self):
+        """Push voice settings to the engine and re-key the cache (worker thread)"""
+        with self.cond:
+            settings = dict(self.settings)
+            self.settings_changed = False
+        if self.engine is None:
+            return
+        self.engine.setProperty('rate', settings["rate"])
+        self.engine.setProperty('volume', settings["volume"])
+        if settings["voice"]:
+            self.engine.setProperty('voice', settings["voice"])
+        if self.cache is not None:
+            settings["voice"] = self.engine.getProperty('voice')
+            self.cache.configure(settings)
+
+    def run(self):
+        """Worker thread: speak queued messages, render clips when idle"""
+        try:
+            import pyttsx3
+            self.engine = pyttsx3.init()
+        except Exception as e:
+            print(f"Voice engine unavailable: {e}")
+        self.apply_settings()
+        self.ready.set()
+
+        while True:
+            with self.cond:
+                while not self.pending and not self.render_jobs and not self.settings_changed:
+                    self.cond.wait()
+                if self.settings_changed:
+                    job, text = "settings", None
+                elif self.pending:
+                    priority, _, text = heapq.heappop(self.pending)
+                    self.speaking = -priority
+                    job = "speak"
+                else:
+                    job, text = "render", self.render_jobs.popleft()
+
+            if job == "settings":
+                self.apply_settings()
+            elif job == "render":
+                self.render(text)
+            else:
+                try:
+                    self.speak_now(text)
+                finally:
+                    with self.cond:
+                        self.speaking = None
+
+    def speak_now(self, text):
+        """Play the cached clip for text, or synthesize it live and cache it later"""
+        clip = self.cache.get(text) if self.cache is not None else None
+        try:
+            if clip and self.player is not None and self.player.available:
+                self.player.play(clip)
+                return
+            if self.engine is not None:
+                self.engine.say(text)
+                self.engine.runAndWait()
+        except Exception:
+            pass  # Silently fail if voice engine has issues
+        if self.cache is not None and clip is None:
+            with self.cond:
+                self.render_jobs.append(text)
+
+    def render(self, text):
+        """Synthesize text into the clip cache (worker thread)"""
+        if self.engine is None or self.cache.get(text) is not None:
+            return
+        path = self.cache.path_for(text)
+        try:
+            self.engine.save_to_file(text, path)
+            self.engine.runAndWait()
+        except Exception as e:
+            print(f"Error rendering audio clip: {e}")
+            return
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.cache.add(text, path)
+
+speech = SpeechWorker(cache=AudioClipCache(), player=ClipPlayer())
+
+def speak(text, priority=PRIORITY_FEEDBACK, cooldown=True):
+    """Speak text using text-to-speech with cooldown"""
+    return speech.say(text, priority, cooldown)
+
+def calculate_angle(a, b, c):
+    """Calculate angle between three points"""
+    a = np.array(a)
+    b = np.array(b)
+    c = np.array(c)
+
+    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
+    angle = np.abs(radians*180.0/np.pi)
+
+    if angle > 180.0:
+        angle = 360 - angle
+    return angle
+
+# ===== Batched joint-angle engine =====
+# Each entry is (name, point a, vertex b, point c) using MediaPipe landmark indices.
+# All angles a pose rule may need are computed together once per frame.
+JOINT_ANGLES = (
+    ("left_hip_opening", 25, 23, 24),   # left knee - left hip - right hip
+    ("left_knee", 23, 25, 27),          # left hip - left knee - left ankle
+    ("right_knee", 24, 26, 28),         # right hip - right knee - right ankle
+    ("left_elbow", 11, 13, 15),         # left shoulder - left elbow - left wrist
+    ("right_elbow", 12, 14, 16),        # right shoulder - right elbow - right wrist
+    ("left_body", 11, 23, 27),          # left shoulder - left hip - left ankle
+    ("right_body", 12, 24, 28),         # right shoulder - right hip - right ankle
+    ("left_back", 11, 23, 25),          # left shoulder - left hip - left knee
+)
+ANGLE_INDEX = {name: i for i, (name, _, _, _) in enumerate(JOINT_ANGLES)}
+_ANGLE_A = np.array([a for _, a, _, _ in JOINT_ANGLES])
+_ANGLE_B = np.array([b for _, _, b, _ in JOINT_ANGLES])
+_ANGLE_C = np.array([c for _, _, _, c in JOINT_ANGLES])
+
+# Columns of the landmark array built once per frame
+LANDMARK_FIELDS = ("x", "y", "z", "visibility")
+NUM_LANDMARKS = 33
+
+def landmarks_to_array(landmarks):
+    """Convert MediaPipe landmarks into a (33, 4) float32 array of x, y, z, visibility"""
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks], dtype=np.float32)
+
+def compute_joint_angles(points):
+    """Compute every angle in JOINT_ANGLES in one pass.
+
+    `points` is a (..., 33, k) landmark array (k >= 2); a batch of frames is
+    accepted as well. Returns a (..., len(JOINT_ANGLES)) array in degrees,
+    indexed by ANGLE_INDEX, matching calculate_angle for each triplet.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    b = points[..., _ANGLE_B, :2]
+    ba = points[..., _ANGLE_A, :2] - b
+    bc = points[..., _ANGLE_C, :2] - b
+
+    radians = np.arctan2(bc[..., 1], bc[..., 0]) - np.arctan2(ba[..., 1], ba[..., 0])
+    angles = np.abs(np.degrees(radians))
+    return np.where(angles > 180.0, 360.0 - angles, angles)
+
+def compute_joint_angles_3d(points):
+    """Like compute_joint_angles, but the true angle between the limbs in 3D"""
+    points = np.asarray(points, dtype=np.float64)
+    b = points[..., _ANGLE_B, :3]
+    ba = points[..., _ANGLE_A, :3] - b
+    bc = points[..., _ANGLE_C, :3] - b
+
+    norms = np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1)
+    cosine = np.einsum("...i,...i->...", ba, bc) / np.maximum(norms, 1e-12)
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+# ===== Per-frame feature vector =====
+# Landmarks whose raw coordinates are exposed to pose rules as "<name>_x" / "<name>_y"
+BODY_LANDMARKS = {
+    "left_shoulder": 11, "right_shoulder": 12,
+    "left_elbow": 13, "right_elbow": 14,
+    "left_wrist": 15, "right_wrist": 16,
+    "left_hip": 23, "right_hip": 24,
+    "left_knee": 25, "right_knee": 26,
+    "left_ankle": 27, "right_ankle": 28,
+}
+# Left/right pairs exposed as "<pair>_y" (average height), "<pair>_width"
+# (horizontal distance) and "<pair>_tilt" (vertical distance)
+BODY_PAIRS = {
+    "shoulder": (11, 12),
+    "elbow": (13, 14),
+    "wrist": (15, 16),
+    "hip": (23, 24),
+    "knee": (25, 26),
+    "ankle": (27, 28),
+}
+_BODY_INDICES = np.array(list(BODY_LANDMARKS.values()))
+_PAIR_LEFT = np.array([left for left, _ in BODY_PAIRS.values()])
+_PAIR_RIGHT = np.array([right for _, right in BODY_PAIRS.values()])
+
+FEATURE_NAMES = (
+    tuple(name for name, _, _, _ in JOINT_ANGLES)
+    + tuple(f"{name}_{axis}" for name in BODY_LANDMARKS for axis in "xy")
+    + tuple(f"{pair}_y" for pair in BODY_PAIRS)
+    + tuple(f"{pair}_width" for pair in BODY_PAIRS)
+    + tuple(f"{pair}_tilt" for pair in BODY_PAIRS)
+)
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+# Landmark indices each feature is computed from, in FEATURE_NAMES order
+FEATURE_LANDMARKS = (
+    tuple((a, b, c) for _, a, b, c in JOINT_ANGLES)
+    + tuple((index,) for index in BODY_LANDMARKS.values() for _ in "xy")
+    + tuple(pair for _ in ("y", "width", "tilt") for pair in BODY_PAIRS.values())
+)
+LANDMARK_NAMES = {index: name.replace("_", " ") for name, index in BODY_LANDMARKS.items()}
+
+def extract_features(points):
+    """Build the feature vector (see FEATURE_NAMES) from a (..., 33, k) landmark array"""
+    points = np.asarray(points, dtype=np.float64)
+    coords = points[..., _BODY_INDICES, :2].reshape(points.shape[:-2] + (-1,))
+    left = points[..., _PAIR_LEFT, :2]
+    right = points[..., _PAIR_RIGHT, :2]
+    return np.concatenate([
+        compute_joint_angles(points),
+        coords,
+        (left[..., 1] + right[..., 1]) / 2,
+        np.abs(left[..., 0] - right[..., 0]),
+        np.abs(left[..., 1] - right[..., 1]),
+    ], axis=-1)
+
+def extract_world_features(points):
+    """Camera-independent feature vector in the FEATURE_NAMES layout from 3D landmarks.
+
+    Meant for MediaPipe's pose_world_landmarks (metres, origin between the
+    hips). Angles are true 3D joint angles; coordinates are relative to the
+    hip midpoint and all distances are in torso lengths (hip midpoint to
+    shoulder midpoint), so they don't change with camera height or the
+    user's distance. Only "<pair>_width", measured in the horizontal x/z
+    plane, survives the user turning about the vertical axis; "<landmark>_x"
+    features follow the body's orientation to the camera, so world-mode rules
+    on them assume the user faces it. Accepts a (..., 33, k>=3) array.
+    """
+    points = np.asarray(points, dtype=np.float64)[..., :3]
+    hip_mid = (points[..., 23, :] + points[..., 24, :]) / 2
+    shoulder_mid = (points[..., 11, :] + points[..., 12, :]) / 2
+    torso = np.maximum(np.linalg.norm(shoulder_mid - hip_mid, axis=-1), 1e-6)
+    body = (points - hip_mid[..., None, :]) / torso[..., None, None]
+
+    coords = body[..., _BODY_INDICES, :2].reshape(points.shape[:-2] + (-1,))
+    left = body[..., _PAIR_LEFT, :]
+    right = body[..., _PAIR_RIGHT, :]
+    return np.concatenate([
+        compute_joint_angles_3d(points),
+        coords,
+        (left[..., 1] + right[..., 1]) / 2,
+        np.hypot(left[..., 0] - right[..., 0], left[..., 2] - right[..., 2]),
+        np.abs(left[..., 1] - right[..., 1]),
+    ], axis=-1)
+
+# ===== Declarative pose rules =====
+# Each pose in pose_instructions.json may carry a "rules" list, checked in order:
+#   {"require": <condition>, "feedback": "message spoken when the condition fails"}
+# A condition is either {"any": [...]}, {"all": [...]} or a feature test:
+#   {"feature": name, "relative_to": name, "abs": true, "min": lo, "max": hi}
+# where the tested value is feature (minus relative_to, made absolute if abs)
+# and must lie strictly between min and max.
+# "feature_mode": "world" on a pose (or on a single rule) tests the rule
+# against extract_world_features instead of the 2D image features; the
+# feature names are the same. Poses without rules use these:
+DEFAULT_POSE_RULES = [
+    {"require": {"all": [{"feature": "shoulder_tilt", "max": 0.02},
+                         {"feature": "hip_tilt", "max": 0.02}]},
+     "feedback": "Your posture is not perfect. Align shoulders and hips perfectly."},
+]
+
+def _feature_index(name):
+    if name not in FEATURE_INDEX:
+        raise ValueError(f"unknown feature '{name}'")
+    return FEATURE_INDEX[name]
+
+def compile_condition(spec):
+    """Compile one rule condition into a predicate over a feature list"""
+    if "any" in spec:
+        parts = [compile_condition(part) for part in spec["any"]]
+        return lambda f: any(part(f) for part in parts)
+    if "all" in spec:
+        parts = [compile_condition(part) for part in spec["all"]]
+        return lambda f: all(part(f) for part in parts)
+    if "feature" not in spec:
+        raise ValueError(f"condition needs 'feature', 'any' or 'all': {spec}")
+
+    index = _feature_index(spec["feature"])
+    lo = spec.get("min", -np.inf)
+    hi = spec.get("max", np.inf)
+    if "relative_to" in spec:
+        ref = _feature_index(spec["relative_to"])
+        if spec.get("abs"):
+            return lambda f: lo < abs(f[index] - f[ref]) < hi
+        return lambda f: lo < f[index] - f[ref] < hi
+    if spec.get("abs"):
+        return lambda f: lo < abs(f[index]) < hi
+    return lambda f: lo < f[index] < hi
+
+FEATURE_MODES = ("image", "world")
+
+def compile_pose_rules(pose_data):
+    """Compile the rules of every pose into {pose name: ((predicate, feedback, world), ...)}"""
+    compiled = {}
+    for pose_name, data in pose_data.items():
+        checks = []
+        for rule in data.get("rules", DEFAULT_POSE_RULES):
+            try:
+                mode = rule.get("feature_mode", data.get("feature_mode", "image"))
+                if mode not in FEATURE_MODES:
+                    raise ValueError(f"unknown feature_mode '{mode}'")
+                checks.append((compile_condition(rule["require"]), rule["feedback"], mode == "world"))
+            except KeyError as e:
+                raise ValueError(f"{pose_name}: rule is missing {e}") from None
+            except ValueError as e:
+                raise ValueError(f"{pose_name}: {e}") from None
+        compiled[pose_name] = tuple(checks)
+    return compiled
+
+def condition_features(spec):
+    """Names of all features a rule condition reads"""
+    if "any" in spec or "all" in spec:
+        return set().union(*(condition_features(part) for part in spec.get("any", spec.get("all"))))
+    return {spec["feature"]} | ({spec["relative_to"]} if "relative_to" in spec else set())
+
+def required_landmarks(pose_data):
+    """{pose name: sorted landmark indices its rules depend on}"""
+    required = {}
+    for pose_name, data in pose_data.items():
+        indices = set()
+        for rule in data.get("rules", DEFAULT_POSE_RULES):
+            for name in condition_features(rule["require"]):
+                indices.update(FEATURE_LANDMARKS[FEATURE_INDEX[name]])
+        required[pose_name] = np.array(sorted(indices), dtype=np.intp)
+    return required
+
+def check_pose_rules(checks, features, world_features=None):
+    """Return (pose_ok, feedback) for the first failing check of a compiled pose"""
+    f = features.tolist()
+    w = world_features.tolist() if world_features is not None else None
+    for predicate, feedback, world in checks:
+        if not predicate(w if world else f):
+            return False, feedback
+    return True, None
+
+# ===== Multi-pose classifier =====
+class PoseClassifier:
+    """Score every pose at once from a shared feature vector.
+
+    Each pose's rules act as its template: every feature test becomes a soft
+    score (a sigmoid of how far the value sits inside its bounds), "any"
+    groups keep their best member, and a pose's score is the mean over its
+    rules. All tests of all poses are evaluated in one NumPy pass.
+    """
+    # Margin (in feature units) that moves a test's soft score from 0.5 to ~0.73
+    ANGLE_SCALE = 10.0
+    DISTANCE_SCALE = 0.05
+    SHARPNESS = 20.0  # Softmax temperature applied to pose scores
+    WRONG_POSE_MARGIN = 0.25  # Score lead another pose needs to be reported
+    # ... and the selected pose's own score must be below this. A pose whose
+    # rules all pass scores above 0.5, so it is never overridden
+    OWN_POSE_CEILING = 0.5
+
+    def __init__(self, pose_data):
+        self.pose_names = list(pose_data)
+        self.pose_index = {name: i for i, name in enumerate(self.pose_names)}
+
+        leaves = []       # (feature, reference, abs, min, max, scale)
+        leaf_terms = []   # term id of each leaf
+        term_poses = []   # pose id of each term
+        for pose_id, pose_name in enumerate(self.pose_names):
+            for rule in pose_data[pose_name].get("rules", DEFAULT_POSE_RULES):
+                try:
+                    terms = self._split_terms(rule["require"])
+                except KeyError as e:
+                    raise ValueError(f"{pose_name}: rule is missing {e}") from None
+                except ValueError as e:
+                    raise ValueError(f"{pose_name}: {e}") from None
+                for term in terms:
+                    for leaf in term:
+                        leaves.append(leaf)
+                        leaf_terms.append(len(term_poses))
+                    term_poses.append(pose_id)
+
+        # Leaves are generated term by term, so each term is a contiguous run
+        self.leaf_feature = np.array([leaf[0] for leaf in leaves], dtype=np.intp)
+        self.leaf_reference = np.array([leaf[1] for leaf in leaves], dtype=np.intp)
+        self.leaf_abs = np.array([leaf[2] for leaf in leaves], dtype=bool)
+        self.leaf_min = np.array([leaf[3] for leaf in leaves], dtype=np.float64)
+        self.leaf_max = np.array([leaf[4] for leaf in leaves], dtype=np.float64)
+        self.leaf_scale = np.array([leaf[5] for leaf in leaves], dtype=np.float64)
+        self.term_starts = np.flatnonzero(np.diff(leaf_terms, prepend=-1)) if leaves else np.array([], dtype=np.intp)
+        self.term_poses = np.array(term_poses, dtype=np.intp)
+        self.term_counts = np.maximum(np.bincount(self.term_poses, minlength=len(self.pose_names)), 1)
+
+    def _split_terms(self, spec):
+        """Flatten a condition into AND-ed terms, each an OR over feature tests"""
+        if "all" in spec:
+            return [term for part in spec["all"] for term in self._split_terms(part)]
+        if "any" in spec:
+            # An "all" nested inside "any" is approximated by its best test
+            return [[leaf for part in spec["any"] for term in self._split_terms(part) for leaf in term]]
+        if "feature" not in spec:
+            raise ValueError(f"condition needs 'feature', 'any' or 'all': {spec}")
+
+        feature = _feature_index(spec["feature"])
+        # The extra slot appended to the feature vector is always zero
+        reference = _feature_index(spec["relative_to"]) if "relative_to" in spec else len(FEATURE_NAMES)
+        scale = self.ANGLE_SCALE if spec["feature"] in ANGLE_INDEX else self.DISTANCE_SCALE
+        return [[(feature, reference, bool(spec.get("abs")),
+                  spec.get("min", -np.inf), spec.get("max", np.inf), scale)]]
+
+    def scores(self, features):
+        """Return a score in [0, 1] for every pose, in pose_names order"""
+        if not len(self.term_poses):
+            return np.zeros(len(self.pose_names))
+        f = np.append(features, 0.0)
+        values = f[self.leaf_feature] - f[self.leaf_reference]
+        values = np.where(self.leaf_abs, np.abs(values), values)
+        margin = np.minimum(values - self.leaf_min, self.leaf_max - values) / self.leaf_scale
+        leaf_scores = 1.0 / (1.0 + np.exp(-np.clip(margin, -50.0, 50.0)))
+
+        term_scores = np.maximum.reduceat(leaf_scores, self.term_starts)
+        totals = np.bincount(self.term_poses, weights=term_scores, minlength=len(self.pose_names))
+        return totals / self.term_counts
+
+    def classify(self, features, top_k=3):
+        """Return the top_k (pose name, confidence) pairs, most likely first"""
+        scores = self.scores(features)
+        if not len(scores):
+            return []
+        weights = np.exp(self.SHARPNESS * (scores - scores.max()))
+        confidences = weights / weights.sum()
+        best = np.argsort(-confidences)[:top_k]
+        return [(self.pose_names[i], float(confidences[i])) for i in best]
+
+    def wrong_pose(self, features, pose_name):
+        """Name of a different pose the user is clearly doing instead, or None"""
+        if pose_name not in self.pose_index:
+            return None
+        scores = self.scores(features)
+        own = scores[self.pose_index[pose_name]]
+        if own >= self.OWN_POSE_CEILING:
+            return None
+        best = int(np.argmax(scores))
+        if self.pose_names[best] == pose_name or scores[best] - own < self.WRONG_POSE_MARGIN:
+            return None
+        return self.pose_names[best]
+
+# ===== Pose checking =====
+class PoseChecker:
+    """Compiled rules and classifier for a set of poses; needs no GUI or camera"""
+    def __init__(self, pose_data):
+        self.pose_data = pose_data
+        self.rules = compile_pose_rules(pose_data)
+        # Poses with at least one rule on the 3D world features
+        self.world_poses = {pose for pose, checks in self.rules.items()
+                            if any(world for _, _, world in checks)}
+        self.required = required_landmarks(pose_data)
+        self.classifier = PoseClassifier(pose_data)
+
+    def calibrated(self, profile):
+        """A checker for the same poses with distance thresholds scaled to a user's profile"""
+        return PoseChecker(scale_pose_data(self.pose_data, profile["x_scale"], profile["y_scale"]))
+
+    def missing_landmarks(self, pose_name, points):
+        """Required landmarks of a pose that are occluded or out of frame; empty if all in view"""
+        required = self.required.get(pose_name)
+        if required is None:
+            return ()
+        selected = points[required]
+        in_view = ((selected[:, 3] >= VISIBILITY_THRESHOLD) &
+                   np.all((selected[:, :2] >= -FRAME_MARGIN) & (selected[:, :2] <= 1 + FRAME_MARGIN), axis=1))
+        return tuple(required[~in_view].tolist())
+
+    def check(self, pose_name, points, features=None, world_points=None):
+        """Return (pose_ok, feedback, wrong_pose) for one frame's (33, k) landmark array.
+
+        world_points are the frame's 3D world landmarks, used by rules in
+        "world" feature mode; without them those rules fall back to the
+        image landmarks, which still gives torso-relative distances.
+        """
+        checks = self.rules.get(pose_name)
+        if checks is None:
+            return False, "Pose not recognized", None
+
+        # Extract every feature the rules need in a single pass
+        if features is None:
+            features = extract_features(points)
+
+        # Check for wrong poses first
+        wrong_pose = self.classifier.wrong_pose(features, pose_name)
+        if wrong_pose:
+            return False, f"You're doing {wrong_pose} instead of {pose_name}", wrong_pose
+
+        world_features = None
+        if pose_name in self.world_poses:
+            world_features = extract_world_features(points if world_points is None else world_points)
+        pose_ok, feedback = check_pose_rules(checks, features, world_features)
+        return pose_ok, feedback, None
+
+# ===== Temporal filters =====
+class OneEuroFilter:
+    """One-Euro low-pass filter applied to a whole landmark array at once.
+
+    Uses frame timestamps rather than frame counts, so it behaves the same
+    whatever rate inference runs at.
+    """
+    def __init__(self, min_cutoff=LANDMARK_MIN_CUTOFF, beta=LANDMARK_BETA, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.derivative = None
+        self.timestamp = None
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        tau = 1.0 / (2.0 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, value, timestamp):
+        """Filter one sample (any array shape) taken at timestamp seconds"""
+        if self.value is None or timestamp <= self.timestamp:
+            self.value = np.array(value, dtype=np.float64)
+            self.derivative = np.zeros_like(self.value)
+            self.timestamp = timestamp
+            return self.value
+
+        dt = timestamp - self.timestamp
+        speed = (value - self.value) / dt
+        self.derivative += self.alpha(self.d_cutoff, dt) * (speed - self.derivative)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.derivative)
+        self.value += self.alpha(cutoff, dt) * (value - self.value)
+        self.timestamp = timestamp
+        return self.value
+
+class VerdictFilter:
+    """Windowed vote with hysteresis over per-frame pose verdicts.
+
+    The pose counts as held once at least enter_ratio of the frames in the
+    trailing window were correct for confirm_time seconds, and is only
+    dropped after fewer than exit_ratio were correct for grace_period seconds.
+    """
+    def __init__(self, window=0.5, enter_ratio=0.8, exit_ratio=0.4,
+                 confirm_time=POSE_CONFIRM_TIME, grace_period=POSE_GRACE_PERIOD):
+        self.window = window
+        self.enter_ratio = enter_ratio
+        self.exit_ratio = exit_ratio
+        self.confirm_time = confirm_time
+        self.grace_period = grace_period
+        self.reset()
+
+    def reset(self):
+        self.samples = deque()  # (timestamp, ok)
+        self.correct_samples = 0
+        self.holding = False
+        self.changed_since = None  # when the vote first disagreed with the state
+
+    def update(self, timestamp, ok):
+        """Add one frame's verdict; returns whether the pose is being held"""
+        self.samples.append((timestamp, ok))
+        self.correct_samples += ok
+        while self.samples[0][0] < timestamp - self.window:
+            self.correct_samples -= self.samples.popleft()[1]
+        ratio = self.correct_samples / len(self.samples)
+
+        if self.holding:
+            disagrees = ratio < self.exit_ratio
+            needed = self.grace_period
+        else:
+            disagrees = ratio >= self.enter_ratio
+            needed = self.confirm_time
+
+        if not disagrees:
+            self.changed_since = None
+        elif self.changed_since is None:
+            self.changed_since = timestamp
+        if self.changed_since is not None and timestamp - self.changed_since >= needed:
+            self.holding = not self.holding
+            self.changed_since = None
+        return self.holding
+
+# ===== Per-user calibration =====
+# Body measurements in normalized image units: (name, ((landmark, landmark), ...)),
+# each the median over the calibration frames of the mean over the pairs
+BODY_MEASUREMENTS = (
+    ("shoulder_width", ((11, 12),)),
+    ("hip_width", ((23, 24),)),
+    ("upper_arm", ((11, 13), (12, 14))),
+    ("forearm", ((13, 15), (14, 16))),
+    ("thigh", ((23, 25), (24, 26))),
+    ("shin", ((25, 27), (26, 28))),
+)
+
+class BodyCalibrator:
+    """Measure a user's proportions while they stand in Mountain Pose.
+
+    add() collects frames for duration seconds of the body fully in view and
+    then returns the profile: torso height, limb lengths and the x/y scales
+    that scale_pose_data applies to the distance thresholds.
+    """
+    REQUIRED = np.array(sorted(BODY_LANDMARKS.values()), dtype=np.intp)
+
+    def __init__(self, duration=CALIBRATION_TIME):
+        self.duration = duration
+        self.samples = []
+        self.started = None
+
+    def missing_landmarks(self, points):
+        visible = points[self.REQUIRED, 3] >= VISIBILITY_THRESHOLD
+        return tuple(self.REQUIRED[~visible].tolist())
+
+    def add(self, points, timestamp):
+        """Add one frame; returns the profile once enough time is collected, else None"""
+        if self.started is None:
+            self.started = timestamp
+        self.samples.append(points[:, :2])
+        if timestamp - self.started < self.duration:
+            return None
+        return self.profile(np.array(self.samples))
+
+    @staticmethod
+    def profile(samples):
+        """Profile dict from an (n, 33, 2) array of calibration frames"""
+        torso = (samples[:, [23, 24], 1].mean(axis=1) - samples[:, [11, 12], 1].mean(axis=1))
+        profile = {"torso_height": float(np.median(torso))}
+        for name, pairs in BODY_MEASUREMENTS:
+            a = samples[:, [pair[0] for pair in pairs]]
+            b = samples[:, [pair[1] for pair in pairs]]
+            if name.endswith("_width"):
+                lengths = np.abs(a[..., 0] - b[..., 0])
+            else:
+                lengths = np.linalg.norm(a - b, axis=-1)
+            profile[name] = float(np.median(lengths.mean(axis=1)))
+        # A crouching or sideways user would give nonsense; stay within 2x either way
+        profile["x_scale"] = float(np.clip(profile["shoulder_width"] / REFERENCE_SHOULDER_WIDTH, 0.5, 2.0))
+        profile["y_scale"] = float(np.clip(profile["torso_height"] / REFERENCE_TORSO_HEIGHT, 0.5, 2.0))
+        profile["calibrated"] = time.time()
+        return profile
+
+def distance_axis(spec):
+    """"x" or "y" if a rule leaf tests a horizontal or vertical distance, else None"""
+    feature = spec["feature"]
+    if feature.endswith("_width"):
+        return "x"
+    if feature.endswith("_tilt"):
+        return "y"
+    if "relative_to" in spec and feature.endswith(("_x", "_y")):
+        return feature[-1]
+    return None  # angles and absolute positions don't scale with body size
+
+def scale_pose_data(pose_data, x_scale, y_scale):
+    """Copy of pose_data with every image-space distance threshold rescaled"""
+    scales = {"x": x_scale, "y": y_scale}
+
+    def scale(spec):
+        if "any" in spec or "all" in spec:
+            for part in spec.get("any", spec.get("all")):
+                scale(part)
+            return
+        axis = distance_axis(spec)
+        if axis:
+            for bound in ("min", "max"):
+                if bound in spec:
+                    spec[bound] *= scales[axis]
+
+    scaled = copy.deepcopy(pose_data)
+    for data in scaled.values():
+        data["rules"] = data.get("rules", copy.deepcopy(DEFAULT_POSE_RULES))
+        for rule in data["rules"]:
+            # World features are already in torso units
+            if rule.get("feature_mode", data.get("feature_mode", "image")) != "world":
+                scale(rule["require"])
+    return scaled
+
+class ProfileStore:
+    """User calibration profiles, kept in a JSON file keyed by user name"""
+    def __init__(self, path=PROFILES_FILE):
+        self.path = path
+        self.lock = Lock()
+        try:
+            with open(path, "r") as f:
+                self.profiles = json.load(f)
+        except (OSError, ValueError):
+            self.profiles = {}
+
+    def get(self, user):
+        with self.lock:
+            return self.profiles.get(user)
+
+    def put(self, user, profile):
+        with self.lock:
+            self.profiles[user] = profile
+            try:
+                # Write then rename, so a crash never leaves a partial file
+                with open(self.path + ".tmp", "w") as f:
+                    json.dump(self.profiles, f, indent=2)
+                os.replace(self.path + ".tmp", self.path)
+            except OSError as e:
+                print(f"Error saving profile: {e}")
+
+# ===== Per-session pose state =====
+class PoseSession:
+    """Hold timer and feedback state for one person practicing one pose.
+
+    Fed one landmark array per inference. Results go out through callbacks
+    so the same logic drives the Tk app and headless sessions: say(text,
+    priority) for speech, post(key, value) for "status", "timer" and "stop"
+    updates, and log(kind, value) for telemetry ("hold_start", "hold_end",
+    "feedback", "out_of_view", "calibrated" and "completed"). Frames where
+    landmarks the pose's rules need are not in view skip the rules and
+    feedback entirely; the session reports "step back into frame" once per
+    such stretch.
+
+    Given a BodyCalibrator, the session first measures the user standing in
+    Mountain Pose, swaps in a checker with rescaled thresholds and calls
+    calibrated(profile) before starting the pose itself.
+    """
+    def __init__(self, checker, pose_name, hold_time=30, feedback_cooldown=10,
+                 say=None, post=None, log=None, calibrator=None, calibrated=None):
+        self.checker = checker
+        self.pose_name = pose_name
+        self.hold_time = hold_time
+        self.feedback_cooldown = feedback_cooldown  # seconds between repeated feedback
+        self.say = say or (lambda text, priority=PRIORITY_FEEDBACK, cooldown=True: None)
+        self.post = post or (lambda key, value=None: None)
+        self.log = log or (lambda kind, value=None: None)
+        self.calibrator = calibrator
+        self.calibrated = calibrated or (lambda profile: None)
+        self.landmark_filter = OneEuroFilter()  # Smooths landmark jitter
+        self.verdict_filter = VerdictFilter()   # Debounces the per-frame verdict
+        self.reset()
+
+    def reset(self):
+        self.correct_pose = False
+        self.hold_start = None
+        self.last_feedback_time = None
+        self.completed = False
+        self.in_view = True
+        self.first_timestamp = None
+        self.time_to_correct = None  # seconds from the first frame to the first hold
+        self.longest_hold = 0.0
+        self.landmark_filter.reset()
+        self.verdict_filter.reset()
+
+    def update(self, points, timestamp, world_points=None):
+        """Update the hold timer and feedback from one frame's (33, 4) landmark array.
+
+        world_points, the frame's 3D world landmarks, are passed on for rules
+        in "world" feature mode.
+        """
+        if self.calibrator is not None:
+            self.calibrate(points, timestamp)
+            return
+
+        missing = self.checker.missing_landmarks(self.pose_name, points)
+        if missing:
+            self.out_of_view(missing, timestamp)
+            return
+        if not self.in_view:
+            # Replace the "step back" status; feedback may still be on cooldown
+            self.in_view = True
+            self.post("status", f"👀 Back in view. Hold {self.pose_name}!" if self.correct_pose
+                      else f"👀 Back in view. Get into {self.pose_name}.")
+
+        smoothed = points.copy()
+        smoothed[:, :3] = self.landmark_filter(points[:, :3], timestamp)
+        pose_ok, feedback, wrong_pose = self.checker.check(self.pose_name, smoothed,
+                                                           world_points=world_points)
+        holding = self.verdict_filter.update(timestamp, pose_ok)
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+
+        if holding:
+            if not self.correct_pose:
+                self.say("Your pose is correct. Timer starting now.", PRIORITY_SUCCESS)
+                self.hold_start = timestamp
+                self.post("status", f"✅ Perfect pose! Hold for {self.hold_time} seconds.")
+                if self.time_to_correct is None:
+                    self.time_to_correct = timestamp - self.first_timestamp
+                self.log("hold_start")
+            self.correct_pose = True
+
+            # Update timer; brief wobbles within the grace period don't reset it
+            held = timestamp - self.hold_start
+            self.longest_hold = max(self.longest_hold, held)
+            remaining = max(0, self.hold_time - int(held))
+            self.post("timer", f"{remaining}s")
+
+            if remaining <= 0 and not self.completed:
+                self.say("Excellent! You have held the pose perfectly.", PRIORITY_SUCCESS)
+                self.post("status", "🎉 Pose completed perfectly! Great job!")
+                self.completed = True
+                self.log("completed", round(held, 2))
+                self.post("stop")
+        else:
+            if not pose_ok:
+                # Only provide feedback if it's been a while since last feedback
+                if (self.last_feedback_time is None or
+                        timestamp - self.last_feedback_time > self.feedback_cooldown):
+                    if feedback:
+                        self.say(feedback, PRIORITY_FEEDBACK)
+                        self.post("status", f"❌ {feedback}")
+                        self.log("feedback", feedback)
+                        self.last_feedback_time = timestamp
+                    elif wrong_pose:
+                        self.say(f"you are doing {wrong_pose}         . Please do {self.pose_name}.",
+                                 PRIORITY_FEEDBACK)
+                        self.post("status", f"❌ Wrong pose detected: {wrong_pose}")
+                        self.log("wrong_pose", wrong_pose)
+                        self.last_feedback_time = timestamp
+
+            # The filter can also drop the hold on a correct frame, once the
+            # grace period ran out; the next hold must start over either way
+            if self.correct_pose:
+                self.log("hold_end", round(timestamp - self.hold_start, 2))
+            self.correct_pose = False
+            self.hold_start = None
+            self.post("timer", f"{self.hold_time}s")
+
+    def calibrate(self, points, timestamp):
+        """Feed one frame to the calibrator; switch to the pose once it has a profile"""
+        missing = self.calibrator.missing_landmarks(points)
+        if missing:
+            self.out_of_view(missing, timestamp)
+            return
+        if self.calibrator.started is None:
+            # Usually follows "Get ready for ..." within the cooldown, yet must be heard
+            self.say("Stand tall in Mountain Pose for a moment while I measure you.", PRIORITY_INFO,
+                     cooldown=False)
+        if self.calibrator.started is None or not self.in_view:
+            self.post("status", "📏 Calibrating: stand tall in Mountain Pose")
+        self.in_view = True
+
+        profile = self.calibrator.add(points, timestamp)
+        if profile is None:
+            return
+        self.calibrator = None
+        self.checker = self.checker.calibrated(profile)
+        self.log("calibrated", json.dumps(profile))
+        self.calibrated(profile)
+        self.reset()
+        self.say(f"Calibration done. Now get into {self.pose_name}.", PRIORITY_INFO)
+        self.post("status", f"Calibration done. Get into {self.pose_name}!")
+
+    def out_of_view(self, missing, timestamp):
+        """Handle a frame where the body is not fully in view: no rules, at most one cue"""
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        if self.in_view:
+            self.in_view = False
+            names = ", ".join(LANDMARK_NAMES.get(index, str(index)) for index in missing)
+            self.post("status", f"🚶 Step back into frame ({names} not visible)")
+            self.log("out_of_view", names)
+            if (self.last_feedback_time is None or
+                    timestamp - self.last_feedback_time > self.feedback_cooldown):
+                self.say("Please step back so your whole body is in view.", PRIORITY_FEEDBACK)
+                self.last_feedback_time = timestamp
+
+        # Counts against the hold like a wrong frame, so the grace period still applies
+        if not self.verdict_filter.update(timestamp, False) and self.correct_pose:
+            self.log("hold_end", round(timestamp - self.hold_start, 2))
+            self.correct_pose = False
+            self.hold_start = None
+            self.post("timer", f"{self.hold_time}s")
+
+# ===== Pose sequences =====
+def load_sequences(path=SEQUENCES_FILE, pose_data=None):
+    """{sequence name: {"steps": [{"pose", "hold_time"}, ...], "transition": seconds}}
+
+    A missing file means no sequences; steps naming poses that are not in
+    pose_data raise ValueError.
+    """
+    try:
+        with open(path, "r") as f:
+            sequences = json.load(f)
+    except FileNotFoundError:
+        return {}
+    for name, data in sequences.items():
+        if not data.get("steps"):
+            raise ValueError(f"{name}: sequence has no steps")
+        data.setdefault("transition", TRANSITION_TIME)
+        for step in data["steps"]:
+            if "pose" not in step:
+                raise ValueError(f"{name}: step is missing 'pose'")
+            if pose_data is not None and step["pose"] not in pose_data:
+                raise ValueError(f"{name}: unknown pose '{step['pose']}'")
+            step.setdefault("hold_time", 30)
+    return sequences
+
+class PoseSequence:
+    """State machine running a playlist of poses, one PoseSession per step.
+
+    The caller keeps feeding frames to update() for the whole sequence, so
+    the camera and pose model stay up across steps. States: "pose" while a
+    step's session runs, "transition" for the rest before the next step and
+    "done" once the last pose is held. make_session(pose_name, hold_time,
+    post) builds each step's session; finished(session) is called when a
+    step ends, before the next one is made.
+    """
+    def __init__(self, name, steps, make_session, transition=TRANSITION_TIME,
+                 say=None, post=None, finished=None):
+        self.name = name
+        self.steps = steps
+        self.make_session = make_session
+        self.transition = transition
+        self.say = say or (lambda text, priority=PRIORITY_FEEDBACK, cooldown=True: None)
+        self.post = post or (lambda key, value=None: None)
+        self.finished = finished or (lambda session: None)
+        self.index = 0
+        self.state = "pose"
+        self.transition_end = None
+        self.session = self.start_step()
+
+    @property
+    def pose_name(self):
+        return self.steps[self.index]["pose"]
+
+    @property
+    def completed(self):
+        return self.state == "done"
+
+    def step_post(self, key, value=None):
+        # A step's completion must not stop the run; the sequence decides that
+        if key != "stop":
+            self.post(key, value)
+
+    def start_step(self):
+        step = self.steps[self.index]
+        self.post("status", f"Step {self.index + 1}/{len(self.steps)}: {step['pose']}")
+        self.post("timer", f"{step['hold_time']}s")
+        return self.make_session(step["pose"], step["hold_time"], self.step_post)
+
+    def update(self, points, timestamp, world_points=None):
+        """Feed one frame to the current step, moving through transitions"""
+        if self.state == "done":
+            return
+        if self.state == "transition":
+            remaining = self.transition_end - timestamp
+            if remaining > 0:
+                self.post("status", f"⏭️ Next: {self.pose_name} in {int(remaining) + 1}s")
+                return
+            self.state = "pose"
+            self.session = self.start_step()
+            self.say(f"Now get into {self.pose_name}.", PRIORITY_INFO, cooldown=False)
+
+        self.session.update(points, timestamp, world_points)
+        if not self.session.completed:
+            return
+        self.finished(self.session)
+        # Announcements follow the step's own "Excellent!" within the voice
+        # cooldown, so they bypass it and queue up behind it
+        if self.index + 1 == len(self.steps):
+            self.state = "done"
+            self.say(f"Well done! You have completed {self.name}.", PRIORITY_SUCCESS, cooldown=False)
+            self.post("status", f"🎉 {self.name} completed! Great job!")
+            self.post("stop")
+            return
+        self.index += 1
+        self.state = "transition"
+        self.transition_end = timestamp + self.transition
+        self.say(f"Relax. Next up is {self.pose_name}.", PRIORITY_INFO, cooldown=False)
+
+# ===== Landmark recording and replay =====
+# A recording is a 64-byte header followed by fixed-width records, one per
+# inference frame: a float64 timestamp and the (33, 4) float32 landmark array.
+# Frames without a detected person are stored as NaN landmarks.
+RECORDING_MAGIC = b"YMLM"
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct("<4sHHH54s")  # magic, version, landmarks, fields, pose name
+RECORDING_DTYPE = np.dtype([("timestamp", "<f8"),
+                            ("landmarks", "<f4", (NUM_LANDMARKS, len(LANDMARK_FIELDS)))])
+RECORDINGS_DIR = "recordings"
+
+class LandmarkRecorder:
+    """Append landmark frames of a live session to a recording file"""
+    def __init__(self, path, pose_name=""):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, NUM_LANDMARKS,
+                                              len(LANDMARK_FIELDS), pose_name.encode("utf-8")[:54]))
+        self.record = np.zeros((), dtype=RECORDING_DTYPE)
+        self.frames = 0
+
+    def write(self, timestamp, points=None):
+        """Append one frame; points is a (33, 4) array or None if nobody was detected"""
+        self.record["timestamp"] = timestamp
+        self.record["landmarks"] = np.nan if points is None else points
+        self.file.write(self.record.tobytes())
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+class LandmarkReplay:
+    """Memory-mapped read access to a recording, without running capture or inference"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(RECORDING_HEADER.size)
+        if len(header) < RECORDING_HEADER.size:
+            raise ValueError(f"{path}: not a landmark recording")
+        magic, version, landmarks, fields, pose_name = RECORDING_HEADER.unpack(header)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError(f"{path}: not a landmark recording")
+        if (landmarks, fields) != RECORDING_DTYPE["landmarks"].shape:
+            raise ValueError(f"{path}: unexpected landmark layout {landmarks}x{fields}")
+
+        self.path = path
+        self.pose_name = pose_name.rstrip(b"\0").decode("utf-8", errors="replace")
+        frames = (os.path.getsize(path) - RECORDING_HEADER.size) // RECORDING_DTYPE.itemsize
+        if frames:
+            records = np.memmap(path, dtype=RECORDING_DTYPE, mode="r",
+                                offset=RECORDING_HEADER.size, shape=(frames,))
+        else:
+            records = np.zeros(0, dtype=RECORDING_DTYPE)
+        self.timestamps = records["timestamp"]
+        self.landmarks = records["landmarks"]
+        self.detected = ~np.isnan(self.landmarks[:, 0, 0])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        """Yield (timestamp, points or None) for every recorded frame"""
+        for i in range(len(self)):
+            yield float(self.timestamps[i]), (self.landmarks[i] if self.detected[i] else None)
+
+    def check(self, checker, pose_name=None):
+        """Yield (timestamp, (pose_ok, feedback, wrong_pose)) for each detected frame"""
+        pose_name = pose_name or self.pose_name
+        # Features for the whole recording are extracted in one batch
+        features = extract_features(self.landmarks[self.detected])
+        for timestamp, points, row in zip(self.timestamps[self.detected],
+                                          self.landmarks[self.detected], features):
+            yield float(timestamp), checker.check(pose_name, points, row)
+
+# ===== Session telemetry =====
+# Append-only: a session's events are written as they happen and its
+# summary row once it ends, so nothing is ever updated in place.
+TELEMETRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY, host TEXT, pose TEXT, started REAL, ended REAL,
+    hold_time REAL, completed INTEGER, time_to_correct REAL, longest_hold REAL,
+    inference_fps REAL, frames INTEGER);
+CREATE TABLE IF NOT EXISTS events (session_id TEXT, time REAL, kind TEXT, value TEXT);
+CREATE INDEX IF NOT EXISTS sessions_pose ON sessions (pose);
+CREATE INDEX IF NOT EXISTS events_session ON events (session_id);
+"""
+
+class SessionLog:
+    """Append-only SQLite log of sessions and their events.
+
+    Calls only queue rows; a background thread writes them in batches of up
+    to batch_size, at most flush_interval seconds apart, one transaction per
+    batch. The database runs in WAL mode so the query helpers below (or
+    another process) can read while sessions are being written.
+    """
+    def __init__(self, path=TELEMETRY_DB, batch_size=200, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.host = socket.gethostname()
+        self.cond = Condition()
+        self.pending = deque()  # ("sessions" | "events", row)
+        self.queued = 0
+        self.written = 0
+        self.open_sessions = {}  # id -> (pose, started, hold_time)
+        self.closing = False
+        self.failed = False
+        self.thread = None
+
+    def append(self, table, row):
+        with self.cond:
+            if self.failed or self.closing:
+                return
+            self.pending.append((table, row))
+            self.queued += 1
+            # Wake the writer for the first row of a batch and when a batch is full
+            if len(self.pending) == 1 or len(self.pending) >= self.batch_size:
+                self.cond.notify_all()
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def start_session(self, pose, hold_time):
+        """Log the start of a session; returns its id"""
+        session_id = uuid.uuid4().hex
+        started = time.time()
+        self.open_sessions[session_id] = (pose, started, hold_time)
+        self.append("events", (session_id, started, "start", pose))
+        return session_id
+
+    def event(self, session_id, kind, value=None):
+        self.append("events", (session_id, time.time(), kind, None if value is None else str(value)))
+
+    def end_session(self, session_id, completed, time_to_correct=None, longest_hold=0.0,
+                    inference_fps=None, frames=0):
+        """Log the summary row of a finished session"""
+        pose, started, hold_time = self.open_sessions.pop(session_id)
+        self.append("sessions", (session_id, self.host, pose, started, time.time(), hold_time,
+                                 int(completed), time_to_correct, longest_hold, inference_fps, frames))
+
+    def run(self):
+        """Writer thread: commit queued rows in batches"""
+        try:
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")  # WAL keeps this crash-safe
+            db.executescript(TELEMETRY_SCHEMA)
+        except sqlite3.Error as e:
+            print(f"Session log unavailable: {e}")
+            with self.cond:
+                self.failed = True
+                self.pending.clear()
+                self.written = self.queued
+                self.cond.notify_all()
+            return
+
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                if not self.closing and len(self.pending) < self.batch_size:
+                    # Let the batch fill up a little
+                    self.cond.wait(self.flush_interval)
+                batch = [self.pending.popleft() for _ in range(min(len(self.pending), self.batch_size))]
+                closing = self.closing and not self.pending
+
+            try:
+                with db:
+                    for table in ("events", "sessions"):
+                        rows = [row for name, row in batch if name == table]
+                        if rows:
+                            marks = ", ".join("?" * len(rows[0]))
+                            db.executemany(f"INSERT INTO {table} VALUES ({marks})", rows)
+            except sqlite3.Error as e:
+                print(f"Error writing session log: {e}")
+
+            with self.cond:
+                self.written += len(batch)
+                self.cond.notify_all()
+            if closing:
+                break
+        db.close()
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is written"""
+        with self.cond:
+            target = self.queued
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.written >= target or self.thread is None, timeout)
+
+    def close(self):
+        """Write what is left and stop the writer"""
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+def _read_telemetry(path, query, params=()):
+    """Run a read-only query against the session log"""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        db.row_factory = sqlite3.Row
+        return [dict(row) for row in db.execute(query, params)]
+    finally:
+        db.close()
+
+def pose_aggregates(path=TELEMETRY_DB):
+    """Per pose: session count, completion rate and mean time-to-correct, hold and FPS"""
+    return _read_telemetry(path, """
+        SELECT pose, COUNT(*) AS sessions, AVG(completed) AS completion_rate,
+               AVG(time_to_correct) AS mean_time_to_correct,
+               AVG(longest_hold) AS mean_longest_hold, AVG(inference_fps) AS mean_fps
+        FROM sessions GROUP BY pose ORDER BY sessions DESC""")
+
+def feedback_counts(path=TELEMETRY_DB, pose=None):
+    """How often each feedback message fired, per pose, most frequent first"""
+    return _read_telemetry(path, """
+        SELECT s.pose, e.kind, e.value AS message, COUNT(*) AS count
+        FROM events e JOIN sessions s ON s.id = e.session_id
+        WHERE e.kind IN ('feedback', 'wrong_pose') AND (? IS NULL OR s.pose = ?)
+        GROUP BY s.pose, e.kind, e.value ORDER BY count DESC""", (pose, pose))
+
+def slow_hosts(path=TELEMETRY_DB, min_fps=10.0):
+    """Machines whose sessions average below min_fps of inference"""
+    return _read_telemetry(path, """
+        SELECT host, COUNT(*) AS sessions, AVG(inference_fps) AS mean_fps
+        FROM sessions GROUP BY host HAVING AVG(inference_fps) < ?
+        ORDER BY mean_fps""", (min_fps,))
@@ -3,54 +3,501 @@ import    mediapipe as mp
 import numpy as np
 import tkinter as tk
 from tkinter import ttk, messagebox
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
+from collections import deque, OrderedDict
 import time         
-import pyttsx3
 import json
 from PIL import Image, ImageTk
 import os
+import hashlib
+import getpass
+from concurrent.futures import ThreadPoolExecutor
+
+# Rules, features, sessions and speech live in the headless core and are
+# re-exported here for existing callers
+from yoga_core import *
+
+APP_START = time.perf_counter()  # start of the startup timings, after imports
 
 # Initialize MediaPipe
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
-# Voice engine with lock for thread safety
-engine = pyttsx3.init()
-engine.setProperty('rate', 150)
-engine.setProperty('volume', 0.9)
-voice_lock = Lock()
-last_voice_time = 0
-VOICE_COOLDOWN = 4  # seconds between voice feedback
-
-def speak(text):
-    """Speak text using text-to-speech with cooldown"""
-    def speak_thread():
-        global last_voice_time
-        current_time = time.time()
-
-        with voice_lock:
-            if current_time - last_voice_time >= VOICE_COOLDOWN:
-                try:
-                    engine.say(text)
-                    engine.runAndWait()
-                    last_voice_time = current_time
-                except:
-                    pass  # Silently fail if voice engine has issues
-
-    Thread(target=speak_thread, daemon=True).start()
-
-def calculate_angle(a, b, c):
-    """Calculate angle between three points"""
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians*180.0/np.pi)
-
-    if angle > 180.0:
-        angle = 360 - angle
-    return angle
+DISPLAY_FPS = 30  # camera feed refresh rate, independent of inference rate
+
+# Adaptive inference: quality is lowered or raised to hold this rate
+INFERENCE_TARGET_FPS = float(os.environ.get("YOGAMATE_TARGET_FPS", "15"))
+ROI_PADDING = 0.25  # crop margin around the tracked person, as a fraction of body size
+
+# Profiling overlay and metrics export (toggle the overlay at runtime with F3)
+PROFILE_ENABLED = os.environ.get("YOGAMATE_PROFILE") == "1"
+METRICS_FILE = os.environ.get("YOGAMATE_METRICS_FILE", "yogamate_metrics.json")
+METRICS_INTERVAL = 2.0  # seconds between metrics file updates
+
+# Pose reference images are shown as thumbnails, pre-scaled once and cached on disk
+THUMBNAIL_SIZE = (250, 180)
+THUMBNAIL_DIR = ".thumbnails"
+
+# ===== Frame pipeline =====
+class FrameQueue:
+    """Bounded queue that drops the oldest item instead of blocking the producer"""
+    def __init__(self, maxsize=1, on_drop=None):
+        self.items = deque(maxlen=maxsize)
+        self.cond = Condition()
+        self.on_drop = on_drop  # Called with each item discarded unread
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        """Add an item, discarding the oldest one if the queue is full"""
+        with self.cond:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(self.items[0])
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None if nothing arrives within timeout"""
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def close(self):
+        """Wake up any waiting consumer so it can exit"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class FramePool:
+    """Reusable frame buffers shared between the pipeline stages.
+
+    Each buffer handed out carries a count of the consumers still using it;
+    once all of them have released it, it returns to the free list instead
+    of being garbage collected, so steady-state capture allocates nothing.
+    """
+    def __init__(self, size=6):
+        self.lock = Lock()
+        self.size = size
+        self.free = []
+        self.refs = {}  # id(buffer) -> consumers still holding it
+
+    def acquire(self, shape):
+        """Return a free buffer of the given shape, or None if there is none"""
+        with self.lock:
+            while self.free:
+                buffer = self.free.pop()
+                if buffer.shape == shape:
+                    return buffer
+            return None
+
+    def track(self, buffer, consumers):
+        """Start counting the consumers of a buffer about to be shared"""
+        with self.lock:
+            self.refs[id(buffer)] = consumers
+
+    def release(self, buffer):
+        """Called by each consumer when it no longer needs the buffer"""
+        with self.lock:
+            remaining = self.refs.get(id(buffer), 1) - 1
+            if remaining > 0:
+                self.refs[id(buffer)] = remaining
+                return
+            self.refs.pop(id(buffer), None)
+            if len(self.free) < self.size:
+                self.free.append(buffer)
+
+class StageStats:
+    """Rolling per-stage latency counters shared by the pipeline threads"""
+    def __init__(self, window=120):
+        self.lock = Lock()
+        self.window = window
+        self.samples = {}  # stage -> deque of latencies (seconds)
+        self.times = {}    # stage -> deque of completion times, for rates
+        self.counts = {}
+
+    def record(self, stage, seconds):
+        """Record one latency sample (in seconds) for a stage"""
+        now = time.perf_counter()
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.times[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+            self.samples[stage].append(seconds)
+            self.times[stage].append(now)
+            self.counts[stage] += 1
+
+    def snapshot(self):
+        """Return {stage: {count, fps, mean_ms, max_ms}} over the rolling window"""
+        with self.lock:
+            stats = {}
+            for stage, samples in self.samples.items():
+                times = self.times[stage]
+                span = times[-1] - times[0]
+                stats[stage] = {
+                    "count": self.counts[stage],
+                    "fps": (len(times) - 1) / span if span > 0 else 0.0,
+                    "mean_ms": 1000.0 * sum(samples) / len(samples),
+                    "max_ms": 1000.0 * max(samples),
+                }
+            return stats
+
+    def summary(self):
+        """One-line human readable summary of the snapshot"""
+        return ", ".join(f"{stage}: n={s['count']} avg={s['mean_ms']:.1f}ms max={s['max_ms']:.1f}ms"
+                         for stage, s in self.snapshot().items())
+
+class MetricsExporter:
+    """Periodically write pipeline metrics to a JSON file for fleet monitoring"""
+    def __init__(self, path=METRICS_FILE, interval=METRICS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_write = 0.0
+
+    def maybe_write(self, stats, dropped, startup=None):
+        """Write the current snapshot if interval has passed since the last write"""
+        now = time.monotonic()
+        if now - self.last_write < self.interval:
+            return
+        self.last_write = now
+        data = {"time": time.time(), "stages": stats.snapshot(), "dropped": dropped,
+                "startup": startup or {}}
+        try:
+            # Write then rename, so readers never see a partial file
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+def draw_profile_overlay(image, lines):
+    """Draw profiling text in the top-left corner of a frame"""
+    for i, line in enumerate(lines):
+        y = 18 + 16 * i
+        cv2.putText(image, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(image, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1, cv2.LINE_AA)
+
+class InferenceScheduler:
+    """Pick pose model complexity and input scale to hold a target FPS.
+
+    Tracks a moving average of the time spent per inference and steps down
+    the LEVELS ladder when it exceeds the frame budget, or back up when the
+    average leaves enough headroom for the next level's cost. Changes are
+    spaced by hold_time seconds so the average settles between steps.
+
+    There is no frame skipping: the inference queue keeps only the newest
+    frame, so skipping frames would only lower the inference rate.
+    """
+    # (model_complexity, input scale), best first
+    LEVELS = (
+        (2, 1.0),
+        (1, 1.0),
+        (1, 0.75),
+        (0, 0.75),
+        (0, 0.5),
+    )
+    START_LEVEL = 1  # MediaPipe's default complexity at full resolution
+    STEP_COST = 1.6  # rough cost of a level relative to the one below it
+
+    def __init__(self, target_fps=INFERENCE_TARGET_FPS, hold_time=2.0, smoothing=0.1):
+        self.budget = 1.0 / target_fps
+        self.hold_time = hold_time
+        self.smoothing = smoothing
+        self.level = self.START_LEVEL
+        self.reset()
+
+    def reset(self):
+        self.latency = None
+        self.last_change = time.perf_counter()
+
+    @property
+    def model_complexity(self):
+        return self.LEVELS[self.level][0]
+
+    @property
+    def scale(self):
+        return self.LEVELS[self.level][1]
+
+    def record(self, seconds):
+        """Feed one inference duration; returns True if the level changed"""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.smoothing * (seconds - self.latency)
+
+        now = time.perf_counter()
+        if now - self.last_change < self.hold_time:
+            return False
+
+        level = self.level
+        if self.latency > self.budget and level < len(self.LEVELS) - 1:
+            level += 1
+        elif self.latency * self.STEP_COST < 0.8 * self.budget and level > 0:
+            level -= 1
+        if level == self.level:
+            return False
+
+        self.level = level
+        # The old average says nothing about the new level's cost
+        self.latency = None
+        self.last_change = now
+        return True
+
+    def describe(self):
+        complexity, scale = self.LEVELS[self.level]
+        latency = 1000.0 * self.latency if self.latency is not None else 0.0
+        return f"model {complexity} x{scale:.2f} {latency:4.0f} ms"
+
+class RegionTracker:
+    """Crop inference input to the region around the person seen last frame.
+
+    The box is derived from the previous landmarks with ROI_PADDING added on
+    each side, and is kept as long as the body stays inside it, so MediaPipe's
+    own tracking sees a stable image. Losing the person, or a box covering
+    most of the frame, falls back to full-frame detection.
+    """
+    MIN_VISIBLE = 8  # visible landmarks needed to trust the box
+
+    def __init__(self, padding=ROI_PADDING, min_visibility=0.5, max_area=0.7):
+        self.padding = padding
+        self.min_visibility = min_visibility
+        self.max_area = max_area
+        self.buffer = None
+        self.reset()
+
+    def reset(self):
+        self.box = None  # normalized (x0, y0, x1, y1) to crop next frame, None = full frame
+        self.used = None  # box the last prepared image was cut from
+
+    def prepare(self, frame, scale=1.0):
+        """Return the image to run inference on: the tracked region, scaled.
+
+        Returns frame itself when neither cropping nor scaling applies.
+        """
+        self.used = self.box
+        if self.box is None and scale >= 1.0:
+            return frame
+
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = self.box or (0.0, 0.0, 1.0, 1.0)
+        left, top = int(x0 * width), int(y0 * height)
+        right, bottom = max(int(x1 * width), left + 1), max(int(y1 * height), top + 1)
+        size = (max(int((right - left) * scale), 1), max(int((bottom - top) * scale), 1))
+        if self.buffer is None or self.buffer.shape[1::-1] != size:
+            self.buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        # Also makes the crop contiguous, which MediaPipe requires
+        cv2.resize(frame[top:bottom, left:right], size, dst=self.buffer,
+                   interpolation=cv2.INTER_AREA)
+        self.used = (left / width, top / height, right / width, bottom / height)
+        return self.buffer
+
+    def map_back(self, landmark_list):
+        """Convert landmarks detected in the crop to full-frame normalized coordinates"""
+        if self.used is None:
+            return
+        x0, y0, x1, y1 = self.used
+        box_width, box_height = x1 - x0, y1 - y0
+        for landmark in landmark_list.landmark:
+            landmark.x = x0 + landmark.x * box_width
+            landmark.y = y0 + landmark.y * box_height
+            landmark.z *= box_width  # z shares x's scale
+
+    def update(self, points):
+        """Choose next frame's box from full-frame (33, 4) landmarks, or None if lost"""
+        if points is None:
+            self.box = None
+            return
+        visible = points[points[:, 3] >= self.min_visibility]
+        if len(visible) < self.MIN_VISIBLE:
+            self.box = None
+            return
+
+        left, top = visible[:, :2].min(axis=0).tolist()
+        right, bottom = visible[:, :2].max(axis=0).tolist()
+        if self.box is not None:
+            # Keep the current box while the body stays clear of its edges
+            x0, y0, x1, y1 = self.box
+            margin = 0.3 * self.padding * max(right - left, bottom - top)
+            if (left - margin >= x0 and top - margin >= y0 and
+                    right + margin <= x1 and bottom + margin <= y1):
+                return
+
+        pad = self.padding * max(right - left, bottom - top)
+        box = (max(left - pad, 0.0), max(top - pad, 0.0),
+               min(right + pad, 1.0), min(bottom + pad, 1.0))
+        if (box[2] - box[0]) * (box[3] - box[1]) > self.max_area:
+            box = None  # Not worth cropping
+        self.box = box
+
+# ===== Thread-safe UI updates =====
+class UIDispatcher:
+    """Coalesce UI updates posted by worker threads and apply them on the Tk thread.
+
+    Workers call post(key, value) at any rate; only the latest value per key
+    survives until the next drain, which runs every interval_ms via root.after.
+    Keys registered with compare=True are skipped when the value is unchanged.
+    """
+    def __init__(self, root, interval_ms=1000 // DISPLAY_FPS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.lock = Lock()
+        self.handlers = {}  # key -> (handler, compare)
+        self.pending = {}   # key -> latest value posted since the last drain
+        self.applied = {}   # key -> value currently shown on screen
+        self.root.after(self.interval_ms, self.drain)
+
+    def register(self, key, handler, compare=True):
+        """Route values posted under key to handler on the Tk thread"""
+        self.handlers[key] = (handler, compare)
+
+    def post(self, key, value=None):
+        """Queue a value for key; safe to call from any thread"""
+        with self.lock:
+            self.pending[key] = value
+
+    def reset(self):
+        """Forget what is on screen so the next posted values are always applied"""
+        self.applied.clear()
+
+    def drain(self):
+        """Apply pending updates, then reschedule"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        for key, value in pending.items():
+            handler, compare = self.handlers[key]
+            if compare:
+                if key in self.applied and self.applied[key] == value:
+                    continue
+                self.applied[key] = value
+            try:
+                handler(value)
+            except tk.TclError as e:
+                print(f"Error updating UI ({key}): {e}")
+
+        self.root.after(self.interval_ms, self.drain)
+
+# ===== Pose reference images =====
+class PoseImageCache:
+    """Thumbnails of the pose reference images, decoded once and kept ready.
+
+    Each source image is scaled to size once and saved as a PNG in directory,
+    named after the source path and its mtime, so later runs skip decoding
+    the full-size file until it changes. Thumbnails of every loaded pose stay
+    in memory; Tk PhotoImages are made on demand and the most recently used
+    max_photos of them are kept. load() may be called from any thread,
+    photo() only from the Tk thread.
+    """
+    def __init__(self, directory=THUMBNAIL_DIR, size=THUMBNAIL_SIZE, max_photos=8):
+        self.directory = directory  # None keeps thumbnails in memory only
+        self.size = size
+        self.max_photos = max_photos
+        self.lock = Lock()
+        self.thumbnails = {}          # source path -> PIL thumbnail
+        self.photos = OrderedDict()   # source path -> PhotoImage, least recently used first
+
+    def cache_path(self, path):
+        """Disk cache file for the current version of the source image"""
+        key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{key}-{os.stat(path).st_mtime_ns}.png")
+
+    def load(self, path):
+        """The thumbnail for an image file, or None if it can't be read"""
+        with self.lock:
+            if path in self.thumbnails:
+                return self.thumbnails[path]
+
+        try:
+            cached = self.cache_path(path) if self.directory else None
+            if cached and os.path.exists(cached):
+                thumbnail = Image.open(cached)
+                thumbnail.load()
+            else:
+                thumbnail = Image.open(path).convert('RGB')
+                thumbnail = thumbnail.resize(self.size, Image.Resampling.LANCZOS)
+                if cached:
+                    self.save(thumbnail, cached)
+        except OSError as e:
+            print(f"Error loading image {path}: {e}")
+            return None
+
+        with self.lock:
+            self.thumbnails[path] = thumbnail
+        return thumbnail
+
+    def save(self, thumbnail, cached):
+        """Write a thumbnail to disk, removing ones made from older versions of its source"""
+        prefix = os.path.basename(cached).split("-")[0] + "-"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix):
+                    os.remove(os.path.join(self.directory, name))
+            thumbnail.save(cached + ".tmp", format="PNG")
+            os.replace(cached + ".tmp", cached)
+        except OSError as e:
+            print(f"Error caching thumbnail: {e}")
+
+    def preload(self, paths):
+        """Decode the thumbnails of all given images"""
+        for path in paths:
+            if os.path.exists(path):
+                self.load(path)
+
+    def photo(self, path):
+        """A PhotoImage of the thumbnail, or None if the image can't be read"""
+        if path in self.photos:
+            self.photos.move_to_end(path)
+            return self.photos[path]
+        thumbnail = self.load(path)
+        if thumbnail is None:
+            return None
+        photo = ImageTk.PhotoImage(thumbnail)
+        self.photos[path] = photo
+        while len(self.photos) > self.max_photos:
+            self.photos.popitem(last=False)
+        return photo
+
+# ===== Background asset loading =====
+class AssetPreloader:
+    """Run slow one-off loading tasks on worker threads after the window is up.
+
+    Tasks are (name, function) pairs run on a small thread pool; progress is
+    posted to the UI dispatcher under "preload" as (done, total, name).
+    """
+    def __init__(self, ui, tasks, workers=3):
+        self.ui = ui
+        self.tasks = list(tasks)
+        self.workers = workers
+        self.lock = Lock()
+        self.done = 0
+        self.started = None
+        self.elapsed = None  # seconds from start() until the last task finished
+
+    def start(self):
+        self.started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="preload")
+        for name, task in self.tasks:
+            executor.submit(self.run, name, task)
+        executor.shutdown(wait=False)
+
+    def run(self, name, task):
+        try:
+            task()
+        except Exception as e:
+            print(f"Error preloading {name}: {e}")
+        with self.lock:
+            self.done += 1
+            if self.done == len(self.tasks):
+                self.elapsed = time.perf_counter() - self.started
+            # Posted under the lock: the dispatcher keeps only the last value,
+            # which must not be an older count from a slower thread
+            self.ui.post("preload", (self.done, len(self.tasks), name))
 
 class YogaMateApp:
     def __init__(self, root):
@@ -62,15 +509,28 @@ class YogaMateApp:
         # Load pose instructions
         self.load_pose_instructions()
 
+        # Render the fixed spoken phrases to audio clips while the app is idle
+        speech.prerender(self.spoken_phrases())
+
         self.running = False
-        self.correct_pose = False
-        self.hold_start = None
         self.hold_time = 30
-        self.current_pose = ""
-        self.last_feedback_time = 0
-        self.feedback_cooldown = 10  # seconds between repeated feedback
-        self.pose_images = {}  # Cache for loaded images
-        self.pose_correct_count = 0  # Counter for consecutive correct pose frames
+        self.session = None  # PoseSession of the pose being practiced
+        self.sequence = None  # PoseSequence running the session's poses in flow mode
+        self.recorder = None  # LandmarkRecorder of the current pose while recording
+        self.camera_thread = None
+        self.pose_images = PoseImageCache()
+        self.warm_pose = None  # (model_complexity, Pose) loaded ahead of the first session
+        self.warm_lock = Lock()
+        self.startup_times = {}  # seconds: "window", "preload", "first_frame"
+        self.session_started = None  # set until the session's first frame is shown
+        self.stage_stats = StageStats()
+        self.telemetry = SessionLog()
+        self.session_id = None  # telemetry id of the running session
+        self.profiles = ProfileStore()  # per-user body calibration
+        # Kept across sessions: the level it settles on reflects this machine
+        self.scheduler = InferenceScheduler()
+        self.region_tracker = RegionTracker()
+        self.show_profile = PROFILE_ENABLED  # Profiling overlay on the camera feed
 
         # ======= Breathing Exercise Variables (COMMENTED) =======
         # self.breathing_active = False
@@ -80,8 +540,20 @@ class YogaMateApp:
 
         self.setup_ui()
 
+        # Worker threads never touch widgets directly; they post through here
+        self.ui = UIDispatcher(self.root)
+        self.ui.register("camera", self.show_camera_image, compare=False)
+        self.ui.register("timer", lambda text: self.timer_label.config(text=text))
+        self.ui.register("status", self.update_status)
+        self.ui.register("stop", lambda _: self.stop_session(), compare=False)
+        self.ui.register("preload", self.show_preload_progress, compare=False)
+        self.root.bind("<F3>", self.toggle_profile)
+
+        # Slow assets load once the window is on screen
+        self.root.after(100, self.start_preloading)
+
     def load_pose_instructions(self):
-        """Load pose instructions from JSON file"""
+        """Load pose instructions from JSON file and compile their rules"""
         try:
             with open('pose_instructions.json', 'r') as f:
                 self.pose_data = json.load(f)
@@ -89,6 +561,25 @@ class YogaMateApp:
             messagebox.showerror("Error", "Pose instructions file not found!")
             self.pose_data = {}
 
+        try:
+            self.pose_checker = PoseChecker(self.pose_data)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid pose rules: {e}")
+            self.pose_checker = PoseChecker({})
+
+        try:
+            self.sequences = load_sequences(pose_data=self.pose_data)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid pose sequences: {e}")
+            self.sequences = {}
+
+    def spoken_phrases(self):
+        """Every fixed phrase the app may speak, for the audio clip cache"""
+        phrases = list(SESSION_PHRASES) + list(BREATHING_PHRASES)
+        for data in self.pose_data.values():
+            phrases.extend(rule["feedback"] for rule in data.get("rules", DEFAULT_POSE_RULES))
+        return list(dict.fromkeys(phrases))
+
     def setup_ui(self):
         """Setup the enhanced user interface"""
         # ====== HEADER ======
@@ -190,6 +681,17 @@ class YogaMateApp:
         self.pose_dropdown.bind("<Enter>", on_enter)
         self.pose_dropdown.bind("<Leave>", on_leave)
 
+        # Flow mode runs a whole sequence of poses in one session
+        tk.Label(yoga_frame, text="🔁 Flow", font=("Helvetica", 12),
+                 bg="#f8f9fa").pack(anchor="w")
+        self.flow_var = tk.StringVar()
+        self.flow_dropdown = ttk.Combobox(yoga_frame, textvariable=self.flow_var,
+                                          font=("Helvetica", 12), state="readonly")
+        self.flow_dropdown["values"] = ["Single pose"] + list(self.sequences.keys())
+        self.flow_dropdown.current(0)
+        self.flow_dropdown.pack(fill="x", pady=(0,10))
+        self.flow_dropdown.bind("<<ComboboxSelected>>", self.on_flow_select)
+
         # Configure hover style
         style = ttk.Style()
         style.configure("Hover.TCombobox", fieldbackground="#e0f7fa", bordercolor="#00bca0")
@@ -269,6 +771,22 @@ class YogaMateApp:
                                   command=self.stop_session, state="disabled")
         self.stop_btn.pack(side="left", padx=2)
 
+        # Save the session's landmarks so rule changes can be replayed offline
+        self.record_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(timer_frame, text="Record landmarks", variable=self.record_var,
+                       font=("Helvetica", 10), bg="#f8f9fa").pack(anchor="w")
+
+        # Rule distances are scaled to the user's body, measured once per profile
+        profile_frame = tk.Frame(timer_frame, bg="#f8f9fa")
+        profile_frame.pack(anchor="w")
+        tk.Label(profile_frame, text="User:", font=("Helvetica", 10), bg="#f8f9fa").pack(side="left")
+        self.user_var = tk.StringVar(value=getpass.getuser())
+        tk.Entry(profile_frame, textvariable=self.user_var, width=12,
+                 font=("Helvetica", 10)).pack(side="left", padx=(2, 5))
+        self.recalibrate_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(profile_frame, text="Recalibrate", variable=self.recalibrate_var,
+                       font=("Helvetica", 10), bg="#f8f9fa").pack(side="left")
+
         # ===== POSE IMAGE DISPLAY (moved to bottom) =====
         self.image_frame = tk.Frame(sidebar, bg="#f8f9fa", height=180)
         self.image_frame.pack(fill="x", pady=(10,20), padx=10)
@@ -330,23 +848,70 @@ class YogaMateApp:
         self.status_text.pack(fill="x", pady=5)
         self.status_text.config(state="disabled")
 
+        # Shown while models and images load in the background
+        self.preload_frame = tk.Frame(status_frame, bg="white")
+        self.preload_frame.pack(fill="x")
+        self.preload_bar = ttk.Progressbar(self.preload_frame, mode="determinate", length=200)
+        self.preload_bar.pack(side="left")
+        self.preload_label = tk.Label(self.preload_frame, text="Loading...", font=("Helvetica", 9),
+                                      bg="white", fg="#666666")
+        self.preload_label.pack(side="left", padx=8)
+
         # Update initial display
         self.on_pose_select()
 
+    def start_preloading(self):
+        """Warm up the pose model, voice engine and pose images in the background"""
+        self.startup_times["window"] = time.perf_counter() - APP_START
+        tasks = [("pose model", self.load_warm_pose), ("voice", lambda: speech.warm_up(timeout=30))]
+        for pose, data in self.pose_data.items():
+            if "image" in data and os.path.exists(data["image"]):
+                tasks.append((f"{pose} image", lambda path=data["image"]: self.pose_images.load(path)))
+        self.preloader = AssetPreloader(self.ui, tasks)
+        self.preloader.start()
+
+    def load_warm_pose(self):
+        """Load the pose model and run one frame, so the first session starts at full speed"""
+        complexity = self.scheduler.model_complexity
+        pose = mp_pose.Pose(model_complexity=complexity,
+                            min_detection_confidence=0.5, min_tracking_confidence=0.5)
+        pose.process(np.zeros((480, 640, 3), dtype=np.uint8))
+        with self.warm_lock:
+            self.warm_pose = (complexity, pose)
+
+    def take_warm_pose(self, complexity):
+        """The preloaded Pose if it matches complexity, else None"""
+        with self.warm_lock:
+            warm, self.warm_pose = self.warm_pose, None
+        if warm is None:
+            return None
+        if warm[0] != complexity:
+            warm[1].close()
+            return None
+        return warm[1]
+
+    def show_preload_progress(self, progress):
+        """Update the loading bar (Tk thread only)"""
+        done, total, name = progress
+        self.preload_bar.config(maximum=total, value=done)
+        self.preload_label.config(text=f"Loaded {name} ({done}/{total})")
+        if done == total:
+            self.startup_times["preload"] = time.perf_counter() - APP_START
+            print(f"Startup: window after {self.startup_times['window']:.2f}s, "
+                  f"assets loaded after {self.startup_times['preload']:.2f}s "
+                  f"({self.preloader.elapsed:.2f}s in the background)")
+            self.preload_frame.pack_forget()
+
     def load_pose_image(self, pose_name):
         """Load and display pose image"""
         if pose_name in self.pose_data and "image" in self.pose_data[pose_name]:
             image_path = self.pose_data[pose_name]["image"]
             if os.path.exists(image_path):
-                try:
-                    img = Image.open(image_path).convert('RGB')
-                    img = img.resize((250, 180), Image.Resampling.LANCZOS)
-                    photo = ImageTk.PhotoImage(img)
+                photo = self.pose_images.photo(image_path)
+                if photo is not None:
                     self.pose_image_label.config(image=photo, text="")
                     self.pose_image_label.image = photo  # Keep reference
                     return
-                except Exception as e:
-                    print(f"Error loading image: {e}")
     
 
         # Fallback to text
@@ -370,11 +935,27 @@ class YogaMateApp:
 
             # Clear status
             self.update_status("Select a pose and press Start Session")
+    def on_flow_select(self, event=None):
+        """Show the steps of the selected sequence, or the selected pose again"""
+        sequence = self.sequences.get(self.flow_var.get())
+        if not sequence:
+            self.on_pose_select()
+            return
+        self.instruction_text.config(state="normal")
+        self.instruction_text.delete(1.0, tk.END)
+        self.instruction_text.insert(tk.END, f"🔁 {self.flow_var.get()}\n\n")
+        for i, step in enumerate(sequence["steps"], 1):
+            self.instruction_text.insert(tk.END, f"{i}. {step['pose']} ({step['hold_time']}s)\n")
+        self.instruction_text.config(state="disabled")
+        self.load_pose_image(sequence["steps"][0]["pose"])
+
     def on_timer_select(self, event=None):
         """Update hold_time when user selects a timer duration from the dropdown."""
         duration_map = {"30s": 30, "1 min": 60, "3 min": 180}
         sel = self.timer_var.get()
         self.hold_time = duration_map.get(sel, 30)
+        if self.session:
+            self.session.hold_time = self.hold_time
         self.timer_label.config(text=f"{self.hold_time}s")
 
     def on_timer_label_click(self, event=None):
@@ -391,6 +972,37 @@ class YogaMateApp:
         self.status_text.insert(tk.END, f"💬 {message}")
         self.status_text.config(state="disabled")
 
+    def show_camera_image(self, img):
+        """Show a rendered camera frame (Tk thread only)"""
+        start = time.perf_counter()
+        photo = ImageTk.PhotoImage(img)
+        self.camera_label.config(image=photo, text="")
+        self.camera_label.image = photo  # Keep reference
+        self.stage_stats.record("tk_convert", time.perf_counter() - start)
+
+        if self.session_started is not None:
+            # Time to first interactive frame: Start pressed -> camera on screen
+            self.startup_times["first_frame"] = time.perf_counter() - self.session_started
+            self.session_started = None
+            print(f"First camera frame after {self.startup_times['first_frame']:.2f}s")
+
+    def toggle_profile(self, event=None):
+        """Show or hide the profiling overlay"""
+        self.show_profile = not self.show_profile
+
+    def profile_lines(self):
+        """Overlay text: per-stage rate and latency plus dropped frames"""
+        lines = [f"{stage:<11}{s['fps']:5.1f} fps {s['mean_ms']:6.1f} ms"
+                 for stage, s in self.stage_stats.snapshot().items()]
+        lines.append(f"dropped    inf {self.inference_queue.dropped}  disp {self.display_queue.dropped}")
+        lines.append(f"scheduler  {self.scheduler.describe()}")
+        box = self.region_tracker.box
+        lines.append("roi        " + ("full frame" if box is None else
+                                      f"{box[2] - box[0]:.2f} x {box[3] - box[1]:.2f}"))
+        if "first_frame" in self.startup_times:
+            lines.append(f"first frame {1000.0 * self.startup_times['first_frame']:.0f} ms after start")
+        return lines
+
     def start_session(self):
         """Start the yoga session"""
         pose = self.pose_var.get()
@@ -398,21 +1010,37 @@ class YogaMateApp:
             messagebox.showwarning("Warning", "Please select a pose first!")
             return
 
-        self.current_pose = pose
+        self.stage_stats = StageStats()
+        self.user = self.user_var.get().strip() or "default"
+        self.recalibrate = self.recalibrate_var.get()
+        self.recalibrate_var.set(False)
+        self.record = self.record_var.get()  # read here: run_camera is a worker thread
+        flow = self.flow_var.get()
+        if flow in self.sequences:
+            # Steps after the first are started from the inference thread
+            sequence = self.sequences[flow]
+            self.sequence = PoseSequence(flow, sequence["steps"], self.new_session,
+                                         sequence["transition"], say=speak, post=self.ui.post,
+                                         finished=lambda session: self.end_telemetry())
+            pose = flow
+        else:
+            self.sequence = None
+            self.new_session(pose, self.hold_time, self.ui.post)
+        self.session_started = time.perf_counter()
         self.running = True
-        self.correct_pose = False
-        self.hold_start = None
-        self.last_feedback_time = 0
 
         self.start_btn.config(state="disabled")
         self.stop_btn.config(state="normal")
         self.pose_dropdown.config(state="disabled")
+        self.flow_dropdown.config(state="disabled")
 
         self.update_status(f"Starting {pose}... Get ready!")
-        speak(f"Get ready for {pose}. Timer will start only when your pose is perfect.")
+        self.ui.reset()
+        speak(f"Get ready for {pose}. Timer will start only when your pose is perfect.", PRIORITY_INFO)
 
         # Start camera thread
-        Thread(target=self.run_camera, daemon=True).start()
+        self.camera_thread = Thread(target=self.run_camera, daemon=True)
+        self.camera_thread.start()
 
     def stop_session(self):
         """Stop the current session"""
@@ -420,465 +1048,247 @@ class YogaMateApp:
         self.start_btn.config(state="normal")
         self.stop_btn.config(state="disabled")
         self.pose_dropdown.config(state="readonly")
-        self.timer_label.config(text="30s")
+        self.flow_dropdown.config(state="readonly")
+        self.timer_label.config(text=f"{self.hold_time}s")
         self.update_status("Session stopped. Select a new pose to continue.")
 
+    def new_session(self, pose, hold_time, post):
+        """Start the PoseSession (and its telemetry record) for one pose"""
+        session_id = self.telemetry.start_session(pose, hold_time)
+        profile = None if self.recalibrate else self.profiles.get(self.user)
+        if profile:
+            checker, calibrator = self.pose_checker.calibrated(profile), None
+        else:
+            checker, calibrator = self.pose_checker, BodyCalibrator()
+        self.recalibrate = False
+        user = self.user
+        self.session = PoseSession(checker, pose, hold_time=hold_time, say=speak, post=post,
+                                   log=lambda kind, value=None: self.telemetry.event(session_id, kind, value),
+                                   calibrator=calibrator,
+                                   calibrated=lambda profile: self.profiles.put(user, profile))
+        self.session_id = session_id
+        if self.recorder:
+            # Each sequence step gets its own recording, with its pose in the header
+            self.open_recorder(pose)
+        self.step_started = (time.perf_counter(),
+                             self.stage_stats.snapshot().get("inference", {}).get("count", 0))
+        return self.session
+
+    def open_recorder(self, pose_name):
+        """Record landmarks to a new file for pose_name, closing the current one"""
+        self.close_recorder()
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        name = f"{pose_name.replace(' ', '_')}_{time.strftime('%Y%m%d-%H%M%S')}.ylm"
+        self.recorder = LandmarkRecorder(os.path.join(RECORDINGS_DIR, name), pose_name)
+
+    def close_recorder(self):
+        if self.recorder:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.frames} frames to {self.recorder.path}")
+            self.recorder = None
+
+    def end_telemetry(self):
+        """Write the summary row of the running session, or sequence step, once"""
+        if self.session_id is None:
+            return
+        started, frames_before = self.step_started
+        frames = self.stage_stats.snapshot().get("inference", {}).get("count", 0) - frames_before
+        self.telemetry.end_session(self.session_id, self.session.completed,
+                                   self.session.time_to_correct, round(self.session.longest_hold, 2),
+                                   round(frames / (time.perf_counter() - started), 2), frames)
+        self.session_id = None
+
     def run_camera(self):
-        """Run camera and pose detection"""
+        """Run camera and pose detection as a capture -> inference -> render pipeline"""
         cap = cv2.VideoCapture(0)
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
-        with mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
-            while self.running:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # Process frame
-                image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = pose.process(image)
-                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        self.metrics = MetricsExporter() if PROFILE_ENABLED else None
+        # Captured RGB frames are shared by both consumers and recycled via the pool
+        self.frame_pool = FramePool()
+        release = lambda item: self.frame_pool.release(item[1])
+        self.inference_queue = FrameQueue(maxsize=1, on_drop=release)
+        self.display_queue = FrameQueue(maxsize=1, on_drop=release)
+        self.display_buffer = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+        self.latest_landmarks = None  # Landmarks from the most recent inference
+        self.scheduler.reset()
+        self.region_tracker.reset()
+
+        self.recorder = None
+        if self.record:
+            self.open_recorder(self.session.pose_name)
+
+        capture_thread = Thread(target=self.capture_loop, args=(cap,), daemon=True)
+        inference_thread = Thread(target=self.inference_loop, daemon=True)
+        capture_thread.start()
+        inference_thread.start()
+
+        # The render stage runs on this thread until the session ends
+        self.render_loop()
 
-                if results.pose_landmarks:
-                    # Draw landmarks
-                    mp_drawing.draw_landmarks(
-                        image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                        mp_drawing.DrawingSpec(color=(245,117,66), thickness=2, circle_radius=2),
-                        mp_drawing.DrawingSpec(color=(245,66,230), thickness=2, circle_radius=2)
-                    )
-
-                    landmarks = results.pose_landmarks.landmark
-                    pose_ok, feedback, wrong_pose = self.enhanced_pose_check(self.current_pose, landmarks)
-
-                    if pose_ok:
-                        self.pose_correct_count += 1
-                        if self.pose_correct_count >= 10:  # Require 10 consecutive correct frames (~0.1 seconds)
-                            if not self.correct_pose:
-                                speak("Your pose is correct. Timer starting now.")
-                                self.hold_start = time.time()
-                                self.update_status("✅ Perfect pose! Hold for 30 seconds.")
-                            self.correct_pose = True
-
-                            # Update timer
-                            elapsed = int(time.time() - self.hold_start)
-                            remaining = max(0, self.hold_time - elapsed)
-                            self.timer_label.config(text=f"{remaining}s")
-
-                            if remaining <= 0:
-                                speak("Excellent! You have held the pose perfectly.")
-                                self.update_status("🎉 Pose completed perfectly! Great job!")
-                                self.stop_session()
-                                break
-                    else:
-                        self.pose_correct_count = 0  # Reset counter if pose is not correct
-                        current_time = time.time()
-                        # Only provide feedback if it's been a while since last feedback
-                        if (current_time - self.last_feedback_time > self.feedback_cooldown):
-                            if feedback:
-                                speak(feedback)
-                                self.update_status(f"❌ {feedback}")
-                                self.last_feedback_time = current_time
-                            elif wrong_pose:
-                                speak(f"you are doing {wrong_pose}         . Please do {self.current_pose}.")
-                                self.update_status(f"❌ Wrong pose detected: {wrong_pose}")
-                                self.last_feedback_time = current_time
-
-                        self.correct_pose = False
-                        self.hold_start = None
-                        self.timer_label.config(text="30s")
-
-                # Convert to PIL Image for Tkinter
-                img = Image.fromarray(image)
-                img = img.resize((600, 400), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
-
-                # Update camera label
-                self.camera_label.config(image=photo, text="")
-                self.camera_label.image = photo
-
-                # Small delay to prevent UI freezing
-                time.sleep(0.01)
+        self.running = False
+        self.inference_queue.close()
+        self.display_queue.close()
+        capture_thread.join()
+        inference_thread.join()
 
         cap.release()
         cv2.destroyAllWindows()
-        self.stop_session()
+        self.close_recorder()
+        print(f"Pipeline stats: {self.stage_stats.summary()} "
+              f"(dropped: inference={self.inference_queue.dropped}, display={self.display_queue.dropped})")
+
+        self.end_telemetry()
+        self.ui.post("stop")
+
+    def capture_loop(self, cap):
+        """Capture stage: read frames as fast as the camera delivers them"""
+        shape = None
+        while self.running:
+            start = time.perf_counter()
+            buffer = self.frame_pool.acquire(shape) if shape else None
+            ret, frame = cap.read(buffer)
+            if not ret:
+                self.running = False
+                break
+            shape = frame.shape
+
+            # The only color conversion per frame, done in place: MediaPipe
+            # and the display both consume RGB
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+            self.frame_pool.track(frame, consumers=2)
+            captured = time.perf_counter()
+            self.stage_stats.record("capture", captured - start)
+
+            # Both consumers only ever see the newest frame
+            self.inference_queue.put((captured, frame))
+            self.display_queue.put((captured, frame))
+
+    def inference_loop(self):
+        """Inference stage: run MediaPipe on the newest frame and check the pose"""
+        scheduler = self.scheduler
+        complexity = scheduler.model_complexity
+        pose = self.take_warm_pose(complexity) or mp_pose.Pose(
+            model_complexity=complexity, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+        tracker = self.region_tracker
+        try:
+            while self.running:
+                item = self.inference_queue.get(timeout=0.1)
+                if item is None:
+                    continue
+                captured, frame = item
+
+                start = time.perf_counter()
+                image = tracker.prepare(frame, scheduler.scale)
+                if image is not frame:
+                    self.frame_pool.release(frame)
+                results = pose.process(image)
+                if image is frame:
+                    self.frame_pool.release(frame)
+                elapsed = time.perf_counter() - start
+                self.stage_stats.record("inference", elapsed)
+
+                if scheduler.record(elapsed):
+                    print(f"Inference scheduler: {scheduler.describe()}")
+                    if scheduler.model_complexity != complexity:
+                        complexity = scheduler.model_complexity
+                        pose.close()
+                        pose = mp_pose.Pose(model_complexity=complexity,
+                                            min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+                points = world_points = None
+                if results.pose_landmarks:
+                    tracker.map_back(results.pose_landmarks)
+                    points = landmarks_to_array(results.pose_landmarks.landmark)
+                    # 3D landmarks are only converted for poses with world-mode rules
+                    if (results.pose_world_landmarks and
+                            self.session.pose_name in self.pose_checker.world_poses):
+                        world_points = landmarks_to_array(results.pose_world_landmarks.landmark)
+                tracker.update(points)
+                self.latest_landmarks = results.pose_landmarks
+
+                if points is not None:
+                    start = time.perf_counter()
+                    self.handle_pose(points, captured, world_points)
+                    self.stage_stats.record("rules", time.perf_counter() - start)
+
+                if self.recorder:
+                    self.recorder.write(time.time(), points)
+        finally:
+            pose.close()
+
+    def render_loop(self):
+        """Render stage: draw the latest landmarks over the newest frame at DISPLAY_FPS"""
+        frame_interval = 1.0 / DISPLAY_FPS
+        next_frame = time.perf_counter()
+        overlay_lines, overlay_time = [], 0.0
+        while self.running:
+            item = self.display_queue.get(timeout=frame_interval)
+            if item is None:
+                continue
+            captured, frame = item
+
+            # Scale straight into the reusable display buffer; this is also
+            # the copy that keeps drawing off the shared capture frame
+            start = time.perf_counter()
+            image = cv2.resize(frame, DISPLAY_SIZE, dst=self.display_buffer,
+                               interpolation=cv2.INTER_LINEAR)
+            self.frame_pool.release(frame)
+            resized = time.perf_counter()
+            self.stage_stats.record("resize", resized - start)
+
+            landmarks = self.latest_landmarks
+            if landmarks:
+                # Draw landmarks at display resolution
+                mp_drawing.draw_landmarks(
+                    image, landmarks, mp_pose.POSE_CONNECTIONS,
+                    mp_drawing.DrawingSpec(color=(245,117,66), thickness=2, circle_radius=2),
+                    mp_drawing.DrawingSpec(color=(245,66,230), thickness=2, circle_radius=2)
+                )
+            drawn = time.perf_counter()
+            self.stage_stats.record("draw", drawn - resized)
+
+            if self.show_profile:
+                # Refresh the numbers twice a second so the text stays readable
+                if drawn - overlay_time > 0.5:
+                    overlay_lines, overlay_time = self.profile_lines(), drawn
+                draw_profile_overlay(image, overlay_lines)
+
+            # Image.fromarray copies, so the display buffer can be reused
+            # while the Tk thread builds its PhotoImage from this frame
+            self.ui.post("camera", Image.fromarray(image))
+
+            done = time.perf_counter()
+            self.stage_stats.record("to_pil", done - drawn)
+            self.stage_stats.record("end_to_end", done - captured)
+            if self.metrics:
+                self.metrics.maybe_write(self.stage_stats, {"inference": self.inference_queue.dropped,
+                                                            "display": self.display_queue.dropped},
+                                         self.startup_times)
+
+            # Hold a steady display rate; if we fell behind, don't try to catch up
+            next_frame += frame_interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.perf_counter()
+
+    def handle_pose(self, points, timestamp, world_points=None):
+        """Feed one frame's landmarks to the session; ends the run once the pose is held.
+
+        In flow mode the sequence moves on to its next pose instead, so the
+        camera and pose model stay up until the last pose is done.
+        """
+        runner = self.sequence or self.session
+        runner.update(points, timestamp, world_points)
+        if runner.completed:
+            self.running = False
 
     def enhanced_pose_check(self, pose_name, landmarks):
         """Enhanced pose checking with wrong pose detection"""
-        if pose_name not in self.pose_data:
-            return False, "Pose not recognized", None
-
-        # Extract keypoints
-        def lm(index):
-            return [landmarks[index].x, landmarks[index].y]
-
-        # Get all landmarks
-        left_shoulder = lm(11)
-        right_shoulder = lm(12)
-        left_elbow = lm(13)
-        right_elbow = lm(14)
-        left_wrist = lm(15)
-        right_wrist = lm(16)
-        left_hip = lm(23)
-        right_hip = lm(24)
-        left_knee = lm(25)
-        right_knee = lm(26)
-        left_ankle = lm(27)
-        right_ankle = lm(28)
-
-        # Check for wrong poses first
-        wrong_pose = self.detect_wrong_pose(landmarks)
-        if wrong_pose and wrong_pose != pose_name:
-            return False, f"You're doing {wrong_pose} instead of {pose_name}", wrong_pose
-
-        # Relaxed pose-specific checking with Indian English feedback
-        if pose_name == "Tree Pose":
-            # Check if one foot is raised
-            left_foot_height = left_ankle[1]
-            right_foot_height = right_ankle[1]
-            foot_height_diff = abs(left_foot_height - right_foot_height)
-
-            if foot_height_diff < 0.08:  # Both feet on ground - relaxed threshold
-                return False, "Please lift one foot and place it on the other thigh", None
-
-            angle_hip = calculate_angle(left_knee, left_hip, right_hip)
-            if 50 < angle_hip < 130:  # More relaxed range
-                return True, None, None
-            return False, "Lift your knee a bit higher and place foot on inner thigh", None
-
-        elif pose_name == "Warrior II":
-            front_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-            back_leg_angle = calculate_angle(right_hip, right_knee, right_ankle)
-
-            # More relaxed checking
-            if 70 < front_knee_angle < 110 and back_leg_angle > 150:
-                return True, None, None
-            return False, "Bend your front knee to about 90 degrees and keep back leg straight", None
-
-        elif pose_name == "Cobra Pose":
-            # Check if person is lying on stomach with back arched
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-            head_height = (left_shoulder[1] + right_shoulder[1]) / 2  # Approximate head position
-
-            # Person should be lying down (hips and shoulders relatively close in height)
-            if abs(hip_height - shoulder_height) < 0.2:  # Relaxed lying position
-                # Back should be arched (shoulders higher than hips for backbend)
-                if shoulder_height < hip_height - 0.05:  # Shoulders below hips indicates backbend
-                    # Check if chest is lifted (head/shoulders above ground level)
-                    if head_height < 0.7:  # Relaxed check for lifted chest
-                        return True, None, None
-                    return False, "Lift your chest higher off the ground", None
-                return False, "Arch your back more while keeping hips on the ground", None
-            return False, "Lie on your stomach with your hands under your shoulders", None
-
-        elif pose_name == "Standing Prayer Pose":
-            # Check if person is standing upright
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            if shoulder_height < hip_height + 0.3:  # Standing posture (shoulders above hips) - relaxed
-                # Check if hands are at chest level (between shoulders and hips)
-                wrist_height = (left_wrist[1] + right_wrist[1]) / 2
-                if wrist_height > shoulder_height - 0.2 and wrist_height < hip_height + 0.2:  # Relaxed range for chest level
-                    # Check if hands are close together (palms touching)
-                    wrist_distance = abs(left_wrist[0] - right_wrist[0])
-                    if wrist_distance < 0.4:  # Hands close together - relaxed
-                        # Check if elbows are bent (arms folded in prayer position)
-                        left_elbow_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-                        right_elbow_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-                        if left_elbow_angle < 180 and right_elbow_angle < 180:  # Elbows bent - relaxed
-                            return True, None, None
-                        return False, "Bend your elbows and bring hands to heart center", None
-                    return False, "Bring your palms closer together at your chest", None
-                return False, "Bring your hands to chest level in prayer position", None
-            return False, "Stand tall with good posture", None
-
-        elif pose_name == "Downward Dog":
-            # Check for inverted V shape, heels toward floor, arms straight
-            left_body_angle = calculate_angle(left_shoulder, left_hip, left_ankle)
-            right_body_angle = calculate_angle(right_shoulder, right_hip, right_ankle)
-            # Relaxed check for downward dog (inverted V) - angle at hip should be acute
-            if left_body_angle < 170 and right_body_angle < 170:  # Both sides form inverted V (more relaxed range)
-                # Additional check: hips should be higher than shoulders for proper inverted V
-                hip_height = (left_hip[1] + right_hip[1]) / 2
-                shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-                if hip_height < shoulder_height - 0.05:  # Hips above shoulders (relaxed threshold)
-                    return True, None, None
-                return False, "Lift your hips higher to form a proper inverted V shape", None
-            return False, "Lift your hips up and back to form an inverted V shape", None
-
-        elif pose_name == "Bridge Pose":
-            # Check if lying on back with hips lifted - extremely relaxed
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-
-            # Hips should be higher than shoulders (bridge position) - extremely relaxed
-            if hip_height < shoulder_height - 0.05:  # Extremely relaxed hip lift threshold
-                # Check if knees are bent (typical for bridge pose) - extremely relaxed
-                left_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-                right_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
-                if left_knee_angle < 170 and right_knee_angle < 170:  # Knees bent (extremely relaxed)
-                    # Check if back is straight - extremely relaxed
-                    back_angle = calculate_angle(left_shoulder, left_hip, left_knee)
-                    if 120 < back_angle < 240:  # Extremely relaxed range for straight back
-                        return True, None, None
-                    return False, "Keep your back straight while lifting hips", None
-                return False, "Bend your knees and keep feet flat on the ground", None
-            return False, "Lift your hips higher toward the ceiling", None
-
-
-        elif pose_name == "Plank Pose":
-            body_angle = calculate_angle(left_shoulder, left_hip, left_ankle)
-            # Relaxed straight line check
-            if 170 < body_angle < 190:
-                return True, None, None
-            return False, "Keep your body in a straight line from head to heels", None
-
-        elif pose_name == "Easy Standing Forward Bend":
-            # Check if person is bending forward
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            if shoulder_height > hip_height + 0.02:  # Shoulders below hips (more relaxed threshold)
-                return True, None, None
-            return False, "Bend forward from your hips, keeping your back relaxed", None
-
-        elif pose_name == "Standing Side Bend":
-            # Check for side bend (one shoulder higher than the other)
-            shoulder_diff = abs(left_shoulder[1] - right_shoulder[1])
-            if shoulder_diff > 0.05:  # Relaxed threshold for side bend
-                return True, None, None
-            return False, "Raise one arm overhead and lean to the side", None
-
-        elif pose_name == "Easy Warrior":
-            # Check for gentle warrior stance
-            shoulder_width = abs(left_shoulder[0] - right_shoulder[0])
-            left_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-            right_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
-
-            # Check for slight wide stance and gentle knee bend
-            if shoulder_width > 0.1 and (left_knee_angle < 160 or right_knee_angle < 160):
-                return True, None, None
-            return False, "Step one foot back slightly and bend your front knee gently", None
-
-
-        elif pose_name == "Easy Pose":
-            # Check if sitting cross-legged with better detection
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            knee_height = (left_knee[1] + right_knee[1]) / 2
-
-            # Person should be sitting (hips relatively high)
-            if hip_height > 0.6:
-                # Check if knees are apart (cross-legged position)
-                knee_distance = abs(left_knee[0] - right_knee[0])
-                if knee_distance > 0.15:  # Knees should be apart for cross-legged
-                    return True, None, None
-                return False, "Open your knees wider and cross your shins", None
-            return False, "Sit comfortably on the floor with legs crossed", None
-
-        elif pose_name == "Seated Twist":
-            # Check for spinal twist
-            shoulder_alignment = abs(left_shoulder[1] - right_shoulder[1])
-            if shoulder_alignment > 0.03:  # Shoulders not level indicates twist - relaxed threshold
-                return True, None, None
-            return False, "Gently twist your spine while keeping it long", None
-
-        elif pose_name == "Butterfly Pose":
-            # Check if knees are open (butterfly position)
-            knee_distance = abs(left_knee[0] - right_knee[0])
-            if knee_distance > 0.15:  # Knees apart - relaxed threshold
-                return True, None, None
-            return False, "Bring soles of feet together and let knees fall open", None
-
-
-
-        elif pose_name == "Camel Pose":
-            # Check for back arch with hands reaching toward heels (relaxed constraints)
-            back_angle = calculate_angle(left_shoulder, left_hip, left_knee)
-            # Kneeling position with arched back - relaxed threshold
-            if back_angle > 120:  # More relaxed arch requirement
-                # Check if at least one hand is reaching back (wrists behind hips) - relaxed
-                if left_wrist[1] > left_hip[1] - 0.1 or right_wrist[1] > right_hip[1] - 0.1:
-                    return True, None, None
-                return False, "Reach your hands toward your heels while arching your back", None
-            return False, "Arch your back and place hands on lower back first", None
-
-        elif pose_name == "Hero Pose":
-            # Check kneeling with knees together and sitting between heels (relaxed constraints)
-            knee_distance = abs(left_knee[0] - right_knee[0])
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            ankle_height = (left_ankle[1] + right_ankle[1]) / 2
-            knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-
-            # First check if kneeling (knees bent)
-            if knee_angle < 150:  # Knees should be bent for kneeling
-                if knee_distance < 0.25:  # More relaxed knee proximity
-                    if hip_height > ankle_height - 0.1:  # Relaxed sitting requirement (hips below ankles)
-                        return True, None, None
-                    return False, "Sit back between your heels", None
-                return False, "Bring your knees closer together", None
-            return False, "Kneel with your knees together first", None
-
-        elif pose_name == "Chair Pose":
-            # Check squatting position with arms raised (relaxed constraints)
-            knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-            if knee_angle < 160:  # More relaxed knee bend requirement
-                # Check arms raised overhead - at least one arm raised above shoulder
-                if left_wrist[1] < left_shoulder[1] - 0.1 or right_wrist[1] < right_shoulder[1] - 0.1:
-                    return True, None, None
-                return False, "Raise your arms overhead", None
-            return False, "Bend your knees as if sitting back into a chair", None
-
-        elif pose_name == "Mountain Pose":
-            # Check standing tall with arms at sides - extremely relaxed
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            wrist_height = (left_wrist[1] + right_wrist[1]) / 2
-
-            # Person should be standing (shoulders above hips) - extremely relaxed
-            if shoulder_height < hip_height:  # Shoulders should be above hips for standing
-                # Arms should be roughly at sides - extremely lenient
-                if wrist_height > hip_height - 0.2 and wrist_height < shoulder_height + 0.2:  # Arms at sides - extremely relaxed
-                    # Feet reasonably close together - extremely relaxed
-                    ankle_distance = abs(left_ankle[0] - right_ankle[0])
-                    if ankle_distance < 1.0:  # Feet together or hip-width - extremely relaxed
-                        return True, None, None
-                    return False, "Stand with feet together or hip-width apart", None
-                return False, "Let your arms hang naturally at your sides", None
-            return False, "Stand tall with good posture", None
-
-        elif pose_name == "Child Pose":
-            # Check kneeling with knees wide and folding forward - extremely relaxed
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-            knee_distance = abs(left_knee[0] - right_knee[0])
-
-            # Person should be kneeling (hips low in frame) and folded forward - extremely relaxed
-            if hip_height > 0.7 and shoulder_height > hip_height:  # Extremely relaxed kneeling and folded forward
-                # Knees should be apart (wide kneeling position) - extremely relaxed
-                if knee_distance > 0.04:  # Knees wide apart - extremely relaxed
-                    return True, None, None  # Allow without strict arm extension
-                return False, "Widen your knees apart", None
-            return False, "Kneel and fold forward, resting your forehead toward the floor", None
-
-        elif pose_name == "Seated Forward Bend":
-            # Check sitting with legs extended and folding forward - extremely relaxed
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-            knee_height = (left_knee[1] + right_knee[1]) / 2
-
-            # Person should be sitting (hips relatively high) - extremely relaxed
-            if hip_height > 0.5:
-                # Legs should be extended straight (knees relatively low) - extremely relaxed
-                if knee_height > 0.6:  # Knees extended - extremely relaxed
-                    # Should be bending forward (shoulders below hip level) - extremely relaxed
-                    if shoulder_height > hip_height + 0.03:  # Forward fold - extremely relaxed
-                        return True, None, None
-                    return False, "Fold forward from your hips, reaching toward your feet", None
-                return False, "Extend your legs straight out in front of you", None
-            return False, "Sit on the floor with legs extended", None
-
-        elif pose_name == "Cat Pose":
-            # Check on hands and knees with back arched upward - extremely relaxed
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-
-            # Person should be on hands and knees (hips and shoulders at similar height) - extremely relaxed
-            if abs(hip_height - shoulder_height) < 0.25:  # Hands and knees position - extremely relaxed
-                # Back should be arched upward (shoulders higher than hips for cat arch) - extremely relaxed
-                if shoulder_height < hip_height - 0.03:  # Arched back upward - extremely relaxed
-                    return True, None, None
-                return False, "Arch your back upward like a cat", None
-            return False, "Start on your hands and knees", None
-
-        elif pose_name == "Cow Pose":
-            # Check on hands and knees with back arched downward - extremely relaxed
-            hip_height = (left_hip[1] + right_hip[1]) / 2
-            shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-
-            # Person should be on hands and knees (hips and shoulders at similar height) - extremely relaxed
-            if abs(hip_height - shoulder_height) < 0.25:  # Hands and knees position - extremely relaxed
-                # Back should be arched downward (hips higher than shoulders for cow arch) - extremely relaxed
-                if hip_height < shoulder_height - 0.03:  # Arched back downward - extremely relaxed
-                    return True, None, None
-                return False, "Arch your back downward, lifting your chest and gaze", None
-            return False, "Start on your hands and knees", None
-
-        # For other poses, use general checking
-        shoulder_alignment = abs(left_shoulder[1] - right_shoulder[1])
-        hip_alignment = abs(left_hip[1] - right_hip[1])
-
-        if shoulder_alignment < 0.02 and hip_alignment < 0.02:
-            return True, None, None
-        return False, "Your posture is not perfect. Align shoulders and hips perfectly.", None
-
-    def detect_wrong_pose(self, landmarks):
-        """Detect if user is doing a different pose than selected"""
-        def lm(index):
-            return [landmarks[index].x, landmarks[index].y]
-
-        left_shoulder = lm(11)
-        right_shoulder = lm(12)
-        left_elbow = lm(13)
-        right_elbow = lm(14)
-        left_wrist = lm(15)
-        right_wrist = lm(16)
-        left_hip = lm(23)
-        right_hip = lm(24)
-        left_knee = lm(25)
-        right_knee = lm(26)
-        left_ankle = lm(27)
-        right_ankle = lm(28)
-
-        # Check for Tree Pose (one foot raised)
-        left_foot_height = left_ankle[1]
-        right_foot_height = right_ankle[1]
-        foot_height_diff = abs(left_foot_height - right_foot_height)
-        if foot_height_diff > 0.15:
-            return "Tree Pose"
-
-        # Check for Warrior poses (wide stance)
-        shoulder_width = abs(left_shoulder[0] - right_shoulder[0])
-        if shoulder_width > 0.3:  # Wide stance
-            # Check knee bend for Warrior
-            left_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-            right_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
-            if left_knee_angle < 120 or right_knee_angle < 120:
-                return "Warrior Pose"
-
-        # Check for Plank (straight body line)
-        body_angle = calculate_angle(left_shoulder, left_hip, left_ankle)
-        if 170 < body_angle < 190:
-            return "Plank Pose"
-
-        # Check for Chair Pose (squatting with arms raised)
-        knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-        if knee_angle < 140:  # Knees bent
-            # Check if arms are raised overhead
-            if left_wrist[1] < left_shoulder[1] + 0.1 or right_wrist[1] < right_shoulder[1] + 0.1:
-                return "Chair Pose"
-
-        # Check for Bridge Pose (lying on back with hips lifted)
-        hip_height = (left_hip[1] + right_hip[1]) / 2
-        shoulder_height = (left_shoulder[1] + right_shoulder[1]) / 2
-        if hip_height < shoulder_height - 0.1:
-            return "Bridge Pose"
-
-        # Check for Camel Pose (kneeling with arched back and hands reaching back)
-        back_angle = calculate_angle(left_shoulder, left_hip, left_knee)
-        if back_angle > 140:  # Arched back
-            # Check if hands are reaching back
-            if left_wrist[1] > left_hip[1] - 0.05 or right_wrist[1] > right_hip[1] - 0.05:
-                return "Camel Pose"
-
-        # Check for Hero Pose (kneeling with knees together and sitting between heels)
-        knee_distance = abs(left_knee[0] - right_knee[0])
-        hip_height = (left_hip[1] + right_hip[1]) / 2
-        ankle_height = (left_ankle[1] + right_ankle[1]) / 2
-        if knee_distance < 0.15 and hip_height > ankle_height:
-            return "Hero Pose"
-
-        return None  # No specific wrong pose detected
+        return self.pose_checker.check(pose_name, landmarks_to_array(landmarks))
 
     def start_breathing(self):
         """Start the breathing exercise animation"""
@@ -949,6 +1359,13 @@ class YogaMateApp:
         # TEMPORARY FEEDBACK FOR BUTTON PRESS
         self.update_status("Breathing animation (not yet implemented)")
 
+    def close(self):
+        """Stop a running session and let it write its telemetry before exit"""
+        self.running = False
+        if self.camera_thread is not None:
+            self.camera_thread.join(timeout=5.0)
+        self.telemetry.close()
+
     def __del__(self):
         """Cleanup"""
         self.running = False
@@ -959,6 +1376,7 @@ if __name__ == "__main__":
     app = YogaMateApp(root)
     root.protocol("WM_DELETE_WINDOW", lambda: (setattr(app, 'running', False), root.destroy()))
     root.mainloop()
+    app.close()
 
 # BreathingExerciseWidget.py (or place inside your main file as a class)
 
@@ -968,11 +1386,6 @@ class BreathingExerciseWidget(tk.Frame):
         self.breathing_active = False
         self.breathing_size = 30
 
-        # Voice engine
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', 150)
-        self.engine.setProperty('volume', 0.9)
-
         # Canvas for circle and text
         self.breathing_canvas = tk.Canvas(
             self, width=180, height=180, bg="#0a3d62", highlightthickness=0
@@ -1004,13 +1417,8 @@ class BreathingExerciseWidget(tk.Frame):
         self.breathing_btn.pack(pady=16)
 
     def speak(self, text):
-        def speak_thread():
-            try:
-                self.engine.say(text)
-                self.engine.runAndWait()
-            except:
-                pass
-        Thread(target=speak_thread, daemon=True).start()
+        # Breathing cues are paced by the animation, so they skip the cooldown
+        speak(text, PRIORITY_INFO, cooldown=False)
 
     def start_breathing(self):
         if not self.breathing_active: